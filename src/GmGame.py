@@ -147,7 +147,7 @@ class GmGame:
                 else:
                     winnerImg = COMPUTERWINNERIMG
                 break
-            elif GmGame.isBoardFull(mainBoard):
+            elif GmUtils.isBoardFull(mainBoard):
                 # A completely filled board means it's a tie.
                 winnerImg = TIEWINNERIMG
                 if showIntermediateMoves:
@@ -240,12 +240,7 @@ class GmGame:
         )
 
     def isBoardFull(board):
-        # Returns True if there are no empty spaces anywhere on the board.
-        for row in range(GmGameRules.BOARDHEIGHT):
-            for col in range(GmGameRules.BOARDWIDTH):
-                if board[row][col] == GmGame.EMPTY:
-                    return False
-        return True
+        return GmUtils.isBoardFull(board)
 
     def getPlayerColor(player_):
         return GmGame.BLACK if player_.black else GmGame.WHITE
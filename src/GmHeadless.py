@@ -0,0 +1,88 @@
+import time
+from collections import namedtuple
+import numpy as np
+from GmUtils import GmUtils
+from GmGameRules import GmGameRules
+
+# The result of one headless game.
+# winner: 1 if player1 (black) won, 2 if player2 (white) won, 0 for a tie.
+# moves: the moves in the order they were played, including invalid ones (see invalidMoves).
+# times: the time each move took, in nanoseconds.
+# invalidMoves: the indices in moves of the moves that were not valid, and therefore not played.
+GmGameResult = namedtuple("GmGameResult", ["winner", "moves", "times", "invalidMoves", "duration"])
+
+
+# Plays games between two agents with the rules of GmGame.runGame, but without pygame:
+# no window, no images and no waiting for a mouse click between games.
+# This allows running many AI vs AI games on a machine without a display.
+class GmHeadless:
+    BLACK = 1  # the same colours as GmGame
+    WHITE = 2
+
+    # player1 will be set to black.
+    # player2 wil be set to white
+    def runGames(player1, player2, max_time_to_move, nofGames=1):
+        results = []
+        for i in range(nofGames):
+            player1.new_game(
+                True
+            )  # to avoid inconsistencies, I define player1 as black player and player 2 as white player.
+            player2.new_game(False)
+            results.append(GmHeadless.runGame(player1, player2, max_time_to_move))
+        return results
+
+    def runGame(player1, player2, max_time_to_move):
+        startTime = time.time_ns()
+        last_move = ()
+        ply = 1
+        moves = []
+        times = []
+        invalidMoves = []
+        winner = 0
+
+        # black goes first
+        activePlayer = player1 if player1.black else player2
+
+        mainBoard = np.zeros(
+            (GmGameRules.BOARDWIDTH, GmGameRules.BOARDHEIGHT), dtype=np.int8
+        )
+
+        while True:  # main game loop
+            gamestate = (mainBoard, ply)
+            moveStart = time.time_ns()
+            last_move = (column, row) = activePlayer.move(
+                gamestate, last_move, max_time_to_move
+            )
+            times.append(time.time_ns() - moveStart)
+            moves.append(last_move)
+            ply += 1
+
+            color = GmHeadless.BLACK if activePlayer.black else GmHeadless.WHITE
+
+            if GmUtils.isValidMove(mainBoard, column, row):
+                GmUtils.addMoveToBoard(mainBoard, last_move, color)
+                if GmUtils.isWinningMove(last_move, mainBoard):
+                    winner = 1 if activePlayer == player1 else 2
+                    break
+            else:
+                # GmGame does not place an invalid move either: the player just loses its turn
+                invalidMoves.append(len(moves) - 1)
+
+            if GmUtils.isBoardFull(mainBoard):
+                # A completely filled board means it's a tie.
+                break
+            activePlayer = GmUtils.getNonActivePlayer(activePlayer, player1, player2)
+
+        return GmGameResult(winner, moves, times, invalidMoves, time.time_ns() - startTime)
+
+    # Counts the results of runGames: the wins of player1 and player2, the ties,
+    # and the mean and longest time per move of each player, in milliseconds.
+    def summarize(results):
+        summary = {"player1": 0, "player2": 0, "tie": 0}
+        for result in results:
+            summary[["tie", "player1", "player2"][result.winner]] += 1
+        for name, first in (("player1", 0), ("player2", 1)):
+            times = [t for result in results for t in result.times[first::2]]
+            summary[name + "MeanMs"] = sum(times) / len(times) / 1000000 if times else 0.0
+            summary[name + "MaxMs"] = max(times) / 1000000 if times else 0.0
+        return summary
@@ -46,9 +46,10 @@
 
 # TODO: start with Move Center
 
-import random, sys, pygame, time, math, copy
+import random, sys, pygame, time, math, copy, os, signal
 import numpy as np
 from pygame.locals import KEYUP, QUIT, MOUSEBUTTONUP, K_ESCAPE
+import gomoku
 from gomoku import Board, Move, GameState, valid_moves, pretty_board
 from GmUtils import GmUtils
 from GmGameRules import GmGameRules
@@ -56,6 +57,9 @@ from gomoku_ai_marius1_webclient import gomoku_ai_marius1_webclient
 from gomoku_ai_random_webclient import gomoku_ai_random_webclient
 from basePlayer import basePlayer
 from GmGame import GmGame
+import match
+import champion_v2
+import threat_search
 
 
 class GmQuickTests:
@@ -265,3 +269,156 @@ class GmQuickTests:
         GmQuickTests.testPreventWinOther2(aiPlayer, True)
         GmQuickTests.testWinSelf3(aiPlayer, True)
         GmQuickTests.testPreventAdvanced1(aiPlayer, True)
+
+    def testLineTables(nofGames=100, bsize=GmGameRules.BOARDWIDTH):
+        # Plays random games on a gomoku.Position that maintains line tables, and checks every move
+        # against gomoku.check_win on a numpy board. Some moves are taken back and replayed, to test undo,
+        # and for some empty cells the prediction of LineTable.is_winning is checked as well.
+        # Every now and then, the threats of both colours are compared with all empty cells where check_win holds.
+        print("testLineTables")
+        for game in range(nofGames):
+            position = gomoku.Position(bsize, track_lines=True, track_threats=True)
+            state = gomoku.starting_state(bsize)
+            while True:
+                moves = gomoku.valid_moves(state)
+                if len(moves) == 0:
+                    break
+                move = tuple(int(x) for x in random.choice(moves))
+                colour = 2 if state[1] % 2 else 1
+
+                cell = random.choice(moves)
+                index = cell[0] * (bsize + 1) + cell[1]
+                predicted = position.lines.is_winning(index, colour)
+                state[0][cell[0]][cell[1]] = colour
+                actual = gomoku.check_win(state[0], cell)
+                state[0][cell[0]][cell[1]] = 0
+                if predicted != actual:
+                    print("line tables are wrong about a stone on " + str(cell) + " on board: ")
+                    pretty_board(state[0])
+                    return False
+
+                if random.random() < 0.1:
+                    for c in (1, 2):
+                        threats = set()
+                        for empty in moves:
+                            state[0][empty[0]][empty[1]] = c
+                            if gomoku.check_win(state[0], empty):
+                                threats.add(empty[0] * (bsize + 1) + empty[1])
+                            state[0][empty[0]][empty[1]] = 0
+                        if threats != position.lines.threats[c]:
+                            print("line tables have the wrong threats for colour " + str(c) + " on board: ")
+                            pretty_board(state[0])
+                            return False
+
+                if random.random() < 0.2:
+                    position.play(move)
+                    position.undo()
+                ok, win, state = gomoku.move(state, move)
+                position_ok, position_win = position.play(move)
+                if ok != position_ok or win != position_win:
+                    print("line tables disagree with check_win for move " + str(move) + " on board: ")
+                    pretty_board(state[0])
+                    return False
+                if win:
+                    break
+        print("line tables are consistent with check_win")
+        return True
+
+    def testThreatSearch(max_time_ms=1000):
+        # Known positions for threat_search.ThreatSearch on a 15x15 board, with black (colour 2) to move:
+        # - a VCF: the four on (7,10) forces white to block on (8,10), after which (7,9) makes an open four on row 7,
+        # - a VCT: (8,8) makes two open threes at once (which the VCF alone does not find),
+        # - no win for either player (find_win and find_defences return None).
+        print("testThreatSearch")
+
+        def board(black, white):
+            b = np.zeros((15, 15), dtype=np.int8)
+            for cell in black:
+                b[cell] = 2
+            for cell in white:
+                b[cell] = 1
+            return b
+
+        corners = [(0, 0), (0, 14), (14, 0), (14, 14)]
+        vcf = board([(4, 10), (5, 10), (6, 10), (7, 7), (7, 8)], [(3, 10)] + corners)
+        vct = board([(8, 6), (8, 7), (6, 8), (7, 8)], corners)
+        quiet = board([(7, 7), (3, 3)], [(7, 8), (10, 10)])
+        cases = (
+            ("the VCF", threat_search.ThreatSearch(vct_depth=0), (vcf, 11), (7, 10)),
+            ("the VCT", threat_search.ThreatSearch(vct_depth=1), (vct, 9), (8, 8)),
+            ("VCF only in the VCT position", threat_search.ThreatSearch(vct_depth=0), (vct, 9), None),
+            ("no win", threat_search.ThreatSearch(), (quiet, 5), None),
+        )
+        for name, search, state, expected in cases:
+            move = search.find_win(state, max_time_ms)
+            if move != expected:
+                print("the threat search plays " + str(move) + " instead of " + str(expected) + " for " + name + " on board: ")
+                pretty_board(state[0])
+                return False
+        defences = threat_search.ThreatSearch().find_defences((quiet, 5), max_time_ms)
+        if defences is not None:
+            print("the threat search defends against a win that is not there: " + str(defences))
+            return False
+        print("the threat search finds the VCF and the VCT, and no win where there is none")
+        return True
+
+    def testMatchStatistics(nofGames=200, elo0=0.0, elo1=10.0, alpha=0.05, beta=0.05):
+        # A match in which the new player wins (or loses) every game has to stop: the log-likelihood ratio
+        # of match.MatchStatistics must cross the upper (lower) bound of the SPRT, although the results have no spread.
+        print("testMatchStatistics")
+        lower = math.log(beta / (1 - alpha))
+        upper = math.log((1 - beta) / alpha)
+        for score in (1, 0):
+            statistics = match.MatchStatistics()
+            for game in range(nofGames):
+                statistics.add(score)
+            llr = statistics.llr(elo0, elo1)
+            if (score == 1 and llr < upper) or (score == 0 and llr > lower):
+                print("the SPRT does not stop after " + str(nofGames) + " games with score " + str(score) + ": llr " + str(llr))
+                return False
+        print("a one-sided match stops the SPRT")
+        return True
+
+    def testTinyArrayTree(bsize=GmGameRules.BOARDWIDTH):
+        # A search in an array tree that is too small to expand the root, or that runs out of time
+        # before it does, still has to return a valid move.
+        print("testTinyArrayTree")
+        for max_nodes, max_time in ((1, 100), (2, 100), (1 << 10, 0)):
+            player = champion_v2.ChampionV2(tree="array", max_nodes=max_nodes)
+            player.new_game(True)
+            state = gomoku.starting_state(bsize)
+            ok, win, state = gomoku.move(state, (bsize // 2, bsize // 2))
+            ok, win, state = gomoku.move(state, (0, 0))
+            move = player.move((state[0].copy(), state[1]), (0, 0), max_time)
+            ok, win, after = gomoku.move((state[0].copy(), state[1]), move)
+            if not ok:
+                print("no valid move from an array tree of " + str(max_nodes) + " nodes in " + str(max_time) + " ms: " + str(move))
+                return False
+        print("a tiny array tree still moves")
+        return True
+
+    def testPonderStarved(max_time=200, bsize=GmGameRules.BOARDWIDTH):
+        # A pondering process that gets no CPU time at all (as with ponder="strict" on a busy machine)
+        # must not make the player late: it has to be given up, and a new one started for the next move.
+        print("testPonderStarved")
+        player = champion_v2.ChampionV2(ponder="strict")
+        player.new_game(True)
+        state = gomoku.starting_state(bsize)
+        last_move = ()
+        try:
+            for turn in range(3):
+                if turn == 1:
+                    os.kill(player.ponderer.process.pid, signal.SIGSTOP)
+                start = time.time()
+                move = player.move((state[0].copy(), state[1]), last_move, max_time)
+                elapsed = (time.time() - start) * 1000
+                ok, win, state = gomoku.move(state, move)
+                if not ok or elapsed > max_time * 1.05:
+                    print("move " + str(move) + " took " + str(round(elapsed)) + " ms of " + str(max_time) + " ms")
+                    return False
+                last_move = random.choice(gomoku.valid_moves(state))
+                ok, win, state = gomoku.move(state, last_move)
+        finally:
+            player.close()
+        print("a starved ponderer does not delay the move")
+        return True
@@ -1,3 +1,4 @@
+import numpy as np
 from GmGameRules import GmGameRules
 
 class GmUtils:
@@ -141,6 +142,43 @@ class GmUtils:
     def removeTokenFromBoard(board, move):
         board[move[0]][move[1]] = 0  # 0 must mean empty, for this.
 
+    @staticmethod
+    def isBoardFull(board):
+        # Returns True if there are no empty spaces anywhere on the board.
+        if isinstance(board, np.ndarray):
+            return not (board == 0).any()
+        for row in range(len(board)):
+            for col in range(len(board[0])):
+                if board[row][col] == 0:
+                    return False
+        return True
+
+    @staticmethod
+    def getCandidateMoves(board, ply, distance=2):
+        # Returns the valid moves within the given (Chebyshev) distance of a stone.
+        # This shrinks the number of moves to consider a lot in the opening and middlegame.
+        # (gomoku.Position maintains the same set incrementally, for search code.)
+        validMoves = GmUtils.getValidMoves(board, ply)
+        if ply == 1:
+            return validMoves
+
+        candidates = []
+        for move in validMoves:
+            nearStone = False
+            for row in range(max(0, move[0] - distance), min(len(board), move[0] + distance + 1)):
+                for col in range(max(0, move[1] - distance), min(len(board[0]), move[1] + distance + 1)):
+                    if board[row][col] != 0:
+                        nearStone = True
+                        break
+                if nearStone:
+                    break
+            if nearStone:
+                candidates.append(move)
+
+        if len(candidates) == 0:  # no stones on the board yet
+            return validMoves
+        return candidates
+
     @staticmethod
     def getValidMoves(board, ply):
         # First, make a list of all empty spots
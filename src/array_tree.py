@@ -0,0 +1,150 @@
+import math
+import numpy as np
+
+
+class ArrayTree:
+    """
+    A search tree stored as a struct of preallocated numpy arrays instead of one Python object per node.
+    Nodes are indices into the arrays; node 0 is the root. A node does not store its board: the search
+    rebuilds it by playing the moves on the path from the root (see ChampionV2.find_spot_to_expand_array).
+
+    The children of a node are allocated at once, contiguously: child_count[node] children starting at
+    first_child[node], in a random order. The first tried[node] of them have been visited, so the next
+    child to expand is always first_child[node] + tried[node].
+    """
+
+    # The arrays of the tree, in the order they are laid out in its buffer
+    FIELDS = (
+        ("N", np.int64),                # Amount of visits
+        ("Q", np.float64),              # A number of accrued points
+        ("parent", np.int32),
+        ("move", np.int32),             # Move to the node, as row * size + col
+        ("first_child", np.int32),
+        ("child_count", np.int32),
+        ("tried", np.int32),
+        ("expanded", np.bool_),         # Whether the children have been allocated
+        ("winning", np.bool_),          # Whether the move to the node won the game
+    )
+
+    def __init__(self, capacity: int = 1 << 20, buffer = None):
+        """
+        :param capacity: The maximum number of nodes. When the tree is full, leaves are no longer expanded.
+        :param buffer: The memory to keep the arrays in, of at least ArrayTree.nbytes(capacity) bytes
+        (for example the buf of a multiprocessing.shared_memory.SharedMemory, to share the tree between
+        processes). A tree on an existing buffer is not reset: it shows the nodes that are already there.
+        By default, the tree allocates its own memory.
+        """
+        self.capacity = capacity
+        fresh = buffer is None
+        if fresh:
+            buffer = np.zeros(ArrayTree.nbytes(capacity), dtype=np.uint8)
+        # the first 8 bytes hold the number of allocated nodes, the arrays follow
+        self.header = np.ndarray((1,), dtype=np.int64, buffer=buffer, offset=0)
+        offset = 8
+        for name, dtype in ArrayTree.FIELDS:
+            setattr(self, name, np.ndarray((capacity,), dtype=dtype, buffer=buffer, offset=offset))
+            offset += ArrayTree._aligned(capacity * np.dtype(dtype).itemsize)
+        if fresh:
+            self.reset()
+
+    @staticmethod
+    def _aligned(nbytes: int) -> int:
+        return (nbytes + 7) // 8 * 8
+
+    @staticmethod
+    def nbytes(capacity: int) -> int:
+        """Returns the size of the buffer needed for a tree of the given capacity."""
+        return 8 + sum(ArrayTree._aligned(capacity * np.dtype(dtype).itemsize) for name, dtype in ArrayTree.FIELDS)
+
+    @property
+    def size(self) -> int:
+        """The number of allocated nodes."""
+        return int(self.header[0])
+
+    @size.setter
+    def size(self, value: int):
+        self.header[0] = value
+
+    def reset(self):
+        """Empties the tree, leaving only a fresh root node."""
+        self.size = 0
+        self.allocate(1, -1)
+
+    def allocate(self, count: int, parent: int) -> int:
+        """
+        Allocates count fresh nodes with the given parent.
+
+        :return: The index of the first new node, or -1 if the tree is full.
+
+        Runtime complexity: O(count)
+        """
+        first = self.size
+        if first + count > self.capacity:
+            return -1
+        nodes = slice(first, first + count)
+        self.N[nodes] = 0
+        self.Q[nodes] = 0
+        self.parent[nodes] = parent
+        self.first_child[nodes] = -1
+        self.child_count[nodes] = 0
+        self.tried[nodes] = 0
+        self.expanded[nodes] = False
+        self.winning[nodes] = False
+        self.size = first + count
+        return first
+
+    def add_children(self, node: int, moves: list) -> bool:
+        """
+        Allocates the children of a node, one for each of the given moves.
+
+        :param moves: The moves (as row * size + col), in the order they are to be expanded.
+        :return: Whether the children could be allocated (False if the tree is full).
+
+        Runtime complexity: O(n), with n the number of moves
+        """
+        first = self.allocate(len(moves), node)
+        if first < 0:
+            return False
+        self.move[first:first + len(moves)] = moves
+        self.first_child[node] = first
+        self.child_count[node] = len(moves)
+        self.expanded[node] = True
+        return True
+
+    def best_child(self, node: int) -> int:
+        """
+        Returns the child with the highest UCT value. All children must have been visited.
+
+        Runtime complexity: O(n), one vectorized pass over the children
+        """
+        first = self.first_child[node]
+        children = slice(first, first + self.child_count[node])
+        N = np.maximum(self.N[children], 1)  # (in a shared tree, another process may not have backed up yet)
+        uct = self.Q[children] / N + math.sqrt(2) * np.sqrt(math.log(max(self.N[node], 1)) / N)
+        return first + int(np.argmax(uct))
+
+    def best_move(self, node: int = 0) -> int:
+        """
+        Returns the move (as row * size + col) of the visited child with the highest Q/N,
+        or -1 if no child has been visited (for example when the tree was too small to expand the node).
+
+        Runtime complexity: O(n), one vectorized pass over the children
+        """
+        if self.tried[node] == 0:
+            return -1
+        first = self.first_child[node]
+        children = slice(first, first + self.tried[node])
+        value = self.Q[children] / np.maximum(self.N[children], 1)
+        value[self.N[children] == 0] = -math.inf
+        return int(self.move[first + int(np.argmax(value))])
+
+    def most_visited_move(self, node: int = 0) -> int:
+        """
+        Returns the move (as row * size + col) of the child with the most visits, or -1 if no child has been visited.
+
+        Runtime complexity: O(n), one vectorized pass over the children
+        """
+        if self.tried[node] == 0:
+            return -1
+        first = self.first_child[node]
+        return int(self.move[first + int(np.argmax(self.N[first:first + self.tried[node]]))])
@@ -1,35 +1,66 @@
+import numpy as np
+
 import gomoku
-from gomoku import Board, Move, GameState, check_win, valid_moves
+import rollout_engine
+from array_tree import ArrayTree
+from parallel_search import Ponderer, RootParallelPool, TreeParallelSearch
+from threat_search import ThreatSearch
+from time_manager import TimeManager
+from gomoku import Board, Move, GameState
 
 import random
-import copy
 import math
 import time
+from collections import OrderedDict
 
 class Node():
-    def __init__(self, state, parent_node = None, last_move = None, valid_moves = None):
-        self.state = state
+    def __init__(self, ply, parent_node = None, last_move = None, winning = False):
+        self.ply = ply                  # The ply of the position this node represents
         self.last_move = last_move 
         self.parent_node = parent_node       # Pointer for previous state     
-        self.valid_moves = valid_moves
+        self.untried_moves = None       # Moves not expanded yet, filled on the first expansion
+        self.all_moves = False          # Whether those are all valid moves (and not just the candidate moves)
+        self.winning = winning          # Whether last_move won the game
+        self.proven = 1 if winning else 0   # 1 (-1) when the player that made last_move can force a win (loss), see prove
         self.child_nodes = []           # Container with children nodes
+        self.child_moves = []           # The move to each child (with transpositions, a child can have more parents)
+        self.child_N = None             # N and Q of the children, as reached from this node, in contiguous
+        self.child_Q = None             # arrays for best_child_index; allocated when the children are known
         self.N = 0                      # A number of accrued points
         self.Q = 0                      # A number of accrued points
 
-        self.player_id = 1 if (self.state[1] % 2 == 0) else 2 
+        self.player_id = 1 if (self.ply % 2 == 0) else 2    # 1 when black made last_move (black plays the odd plies)
 
-    def calculate_uct_value(self):
+    def set_untried_moves(self, moves: list, all_moves: bool = False):
+        """
+        Sets the moves to expand, in a random order, and allocates the child arrays for them.
+
+        :param all_moves: Whether the moves are all valid moves in the position. Only then can the node be
+        proven through its children all being lost (see ChampionV2.prove).
+
+        Runtime complexity: O(n), with n the number of moves
+        """
+        self.untried_moves = moves
+        self.all_moves = all_moves
+        random.shuffle(self.untried_moves)
+        self.child_N = np.zeros(len(moves))
+        self.child_Q = np.zeros(len(moves))
+
+    def calculate_uct_value(self, parent_visits = None):
         """
         Calculates the UCT value for a node.
 
         :param self: The node to calculate the UCT value for.
+        :param parent_visits: N of the parent the node is reached from (by default: parent_node.N).
         :return: The UCT value for the node.
         
         Runtime complexity: O(1), Only 1 operation is executed.
         """
+        if parent_visits is None:
+            parent_visits = self.parent_node.N
         value = self.Q / self.N
         c = math.sqrt(2)
-        parent_visited = math.sqrt((math.log(self.parent_node.N)) / self.N)
+        parent_visited = math.sqrt((math.log(parent_visits)) / self.N)
         result = value + c * parent_visited
         return result
 
@@ -42,18 +73,31 @@ class Node():
 
         Runtime complexity: O(n), Only loop through all children
         """
-        value = -math.inf
-        child = None
-        for chld in self.child_nodes:
-            if chld.calculate_uct_value() > value:
-                value = chld.calculate_uct_value()
-                child = chld
-        return child
+        return self.child_nodes[self.best_child_index()]
+
+    def best_child_index(self):
+        """
+        Like best_child, but returns the index of the child in child_nodes (and child_moves).
+        The UCT values of all children are computed at once from child_N and child_Q, with the
+        logarithm of the parent visits computed only once. An unvisited child is chosen first, and a child
+        that is a proven loss (see ChampionV2.prove) is never chosen while there are others.
+        With transpositions, these are the visits through this node (which is what UCT1 of Childs et al. uses),
+        rather than the shared N and Q of the children.
+
+        Runtime complexity: O(n), one vectorized pass over the children
+        """
+        count = len(self.child_nodes)
+        N = self.child_N[:count]
+        if not N.all():
+            return int(np.argmin(N))
+        exploration = math.sqrt(2 * math.log(max(self.N, 1)))
+        return int(np.argmax(self.child_Q[:count] / N + exploration / np.sqrt(N)))
 
     def best_move(self):
         """
         This function returns the best move for the current player.
-        The best move is the move that has the highest Q/N value.
+        The best move is a proven win if there is one (see ChampionV2.prove), else the move that has
+        the highest Q/N value among the moves that are not proven to lose.
 
         :return: Tuple with the best move for the current player.
         
@@ -61,13 +105,151 @@ class Node():
         """
         highest_value = -math.inf
         best_child = None
-        for child in self.child_nodes:
+        for child, move in zip(self.child_nodes, self.child_moves):
+            if child.proven == 1:
+                return move
             child_value = child.Q / child.N
+            if child.proven == -1:
+                child_value -= 2    # below any move that is not lost, as Q/N is between -1 and 1
             if child_value > highest_value:
                 highest_value = child_value
-                best_child = child.last_move
+                best_child = move
         return best_child
 
+    def most_visited_move(self):
+        """
+        Returns the move to the child with the most visits (as reached from this node).
+
+        Runtime complexity: O(n), one vectorized pass over the children
+        """
+        return self.child_moves[int(np.argmax(self.child_N[:len(self.child_nodes)]))]
+
+class TranspositionTable():
+    """
+    Maps the Zobrist hash of a position (see gomoku.Position.hash) to the node that was created for it,
+    so the search can use that node again when it reaches the same position by another move order.
+    The transposed positions then share one node, and thereby its N and Q.
+    The table holds at most max_size nodes. When it is full, the least recently used entry is replaced
+    (the node itself stays in the tree, it is just no longer shared).
+    """
+
+    def __init__(self, max_size = 1 << 18):
+        self.max_size = max_size
+        self.table = OrderedDict()
+
+    def get(self, key):
+        """
+        Returns the node stored for the given hash, or None.
+
+        Runtime complexity: O(1)
+        """
+        node = self.table.get(key)
+        if node is not None:
+            self.table.move_to_end(key)
+        return node
+
+    def put(self, key, node):
+        """
+        Stores the node for the given hash, replacing the least recently used entry if the table is full.
+
+        Runtime complexity: O(1)
+        """
+        self.table[key] = node
+        self.table.move_to_end(key)
+        if len(self.table) > self.max_size:
+            self.table.popitem(last = False)
+
+    def clear(self):
+        self.table.clear()
+
+class RandomPolicy:
+    """
+    The rollout policy that plays uniformly random moves (see ChampionV2.playout).
+    Without candidate moves, it shuffles the valid moves once and plays them in that order.
+    """
+
+    uses_threats = False    # Whether the policy needs the threats kept by the line tables of the position (see gomoku.LineTable)
+
+    def play(self, position: gomoku.Position) -> bool:
+        """
+        Plays random moves on the position until the game is won or there are no moves left.
+        The caller takes them back.
+
+        :return: Whether the last move played won the game.
+
+        Runtime complexity: O(n), with n the number of empty cells
+        """
+        if position.candidates is None:
+            valid_moves = position.valid_moves()
+            random.shuffle(valid_moves)
+            for random_move in valid_moves:
+                move_is_valid, winning_move = position.play(random_move)
+                if winning_move:
+                    return True
+            return False
+
+        # the candidate moves change with every stone, so pick each move from the current ones
+        valid_moves = position.valid_moves()
+        while len(valid_moves) > 0:
+            move_is_valid, winning_move = position.play(random.choice(valid_moves))
+            if winning_move:
+                return True
+            valid_moves = position.valid_moves()
+        return False
+
+class ThreatPolicy:
+    """
+    A heavier rollout policy: win if possible, else block a four of the opponent,
+    else play a random move close to the last one. The wins and fours come from the threats that
+    the line tables of the position keep up to date (see gomoku.LineTable), so no move scans the board.
+    """
+
+    uses_threats = True
+    LOCAL_DISTANCE = 2  # The Chebyshev distance to the last move of a local move
+    LOCAL_TRIES = 8     # The number of random local cells tried before any valid move is chosen
+
+    def play(self, position: gomoku.Position) -> bool:
+        """
+        Plays the policy on the position until the game is won or there are no moves left.
+        The caller takes the moves back.
+
+        :return: Whether the last move played won the game.
+
+        Runtime complexity: O(n), with n the number of empty cells
+        """
+        threats = position.lines.threats
+        stride = position.board.stride
+        size = position.board.size
+        distance = ThreatPolicy.LOCAL_DISTANCE
+        while len(position.empty) > 0:
+            colour = 2 if position.ply % 2 else 1
+            if threats[colour]:
+                return position.play(divmod(next(iter(threats[colour])), stride))[1]
+            if threats[3 - colour]:
+                move = divmod(next(iter(threats[3 - colour])), stride)
+            else:
+                move = None
+                last_move = position.last_move()
+                if last_move:
+                    for i in range(ThreatPolicy.LOCAL_TRIES):
+                        row = last_move[0] + random.randint(-distance, distance)
+                        col = last_move[1] + random.randint(-distance, distance)
+                        if 0 <= row < size and 0 <= col < size and (row, col) in position.empty:
+                            move = (row, col)
+                            break
+                if move is None:
+                    move = random.choice(position.valid_moves())
+            move_is_valid, winning_move = position.play(move)
+            if winning_move:
+                return True
+        return False
+
+# The rollout policies by name (see the rollout_policy option of ChampionV2)
+ROLLOUT_POLICIES = {
+    "random": RandomPolicy,
+    "threats": ThreatPolicy,
+}
+
 class ChampionV2:
     """This class specifies a player that just does random moves.
     The use of this class is two-fold: 1) You can use it as a base random roll-out policy.
@@ -75,9 +257,111 @@ class ChampionV2:
     your player
     """
 
-    def __init__(self, black_: bool = True):
-        """Constructor for the player."""
+    PONDER_WAIT = 0.1   # The part of the time to move that move waits for the pondering process to hand over its tree
+
+    def __init__(
+        self,
+        black_: bool = True,
+        rollout_mode: str = "serial",
+        rollouts_per_leaf: int = 10,
+        rollout_policy: str = "random",
+        tree: str = "nodes",
+        max_nodes: int = 1 << 20,
+        transposition_size: int = 0,
+        reuse_tree: bool = True,
+        candidate_distance: int = None,
+        line_tables: bool = False,
+        workers: int = 1,
+        parallel: str = "root",
+        parallel_margin: int = 20,
+        threat_search: bool = False,
+        threat_time: float = 0.2,
+        time_tolerance: float = 0.0,
+        early_stop: bool = True,
+        ponder: str = "off",
+        ):
+        """Constructor for the player.
+
+        :param rollout_mode: "serial" plays the rollouts of a leaf one by one (see rollout),
+        "batch" plays them all at once with the vectorized rollout engine (see batch_playout).
+        :param rollouts_per_leaf: The number of rollouts done for each node found by find_spot_to_expand.
+        :param rollout_policy: How the serial rollouts choose their moves: "random" plays uniformly random
+        moves (see RandomPolicy), "threats" wins or blocks fours when it can (see ThreatPolicy, which turns on
+        the threats of the line tables). The batch rollouts are always random.
+        :param tree: "nodes" builds the search tree out of Node objects, "array" stores it in
+        preallocated numpy arrays (see ArrayTree).
+        :param max_nodes: The capacity of the array tree.
+        :param transposition_size: When > 0, transposed positions in the Node tree share their node
+        through a transposition table of (at most) this many entries (see TranspositionTable).
+        :param reuse_tree: Whether move continues with the subtree of the previous search (see reuse_tree).
+        :param candidate_distance: When set, the search only expands and plays out moves within this
+        (Chebyshev) distance of the stones on the board (see gomoku.Position). The batch rollouts still
+        play all empty cells.
+        :param line_tables: Whether the search position keeps line-length tables, so that finding out
+        whether a move wins takes constant time (see gomoku.LineTable).
+        :param workers: When > 1, the search runs in parallel in this many worker processes,
+        which are started for each new game.
+        :param parallel: "root" gives each worker its own tree (see RootParallelPool), "tree" lets all
+        workers search one array tree in shared memory (see TreeParallelSearch).
+        :param parallel_margin: The milliseconds of the time to move that are kept for
+        communicating with the workers and merging their results.
+        :param threat_search: Whether move first looks for forced wins by fours and threes, for itself and
+        for the opponent (see threat_move). With more than one defence, the search is limited to them
+        (but the parallel searches still search all moves). In mid-game positions the threat search often
+        takes all of threat_time without finding anything, so it is off by default.
+        :param threat_time: The fraction of the time to move that the threat search may take.
+        :param time_tolerance: The fraction of the time to move that the search may take on top of it when
+        the two best moves are close (see TimeManager; only as much as the referee tolerates).
+        :param early_stop: Whether the search stops as soon as its best move cannot be overtaken (see TimeManager).
+        :param ponder: "on" searches on the time of the opponent, in a process of its own that hands over the
+        subtree of the opponent's move (see Ponderer). It counts as one more core in cores. "strict" ponders
+        only on CPU time that nothing else wants, such as the cores the referee reserved for the opponent,
+        and does not count as a core. Pondering is only done for the Node tree without workers.
+        """
+        # The options for the search itself, which the worker processes use as well
+        self.search_options = dict(
+            rollout_mode = rollout_mode,
+            rollouts_per_leaf = rollouts_per_leaf,
+            rollout_policy = rollout_policy,
+            tree = tree,
+            max_nodes = max_nodes,
+            transposition_size = transposition_size,
+            reuse_tree = reuse_tree,
+            candidate_distance = candidate_distance,
+            line_tables = line_tables,
+            threat_search = False,      # The threat search is done once, before the workers search (see move)
+            time_tolerance = time_tolerance,
+            early_stop = early_stop,
+        )
+        self.candidate_distance = candidate_distance
+        self.policy = ROLLOUT_POLICIES[rollout_policy]()
+        self.line_tables = line_tables
+        self.track_threats = self.policy.uses_threats  # (only the threat policy pays for keeping the threats)
+        self.workers = workers
+        self.ponder = ponder if tree == "nodes" and workers == 1 else "off"
+        self.ponderer = None            # The pondering process (only when pondering)
+        self.handover_ms = 0            # The time it took to hand the search over to it (see move)
+        self.cores = workers + (self.ponder == "on")    # The number of cores the player uses (see Competition.concurrent_games)
+        self.parallel = parallel
+        self.parallel_margin = parallel_margin
+        self.pool = None                # The worker processes (only when workers > 1)
         self.black = black_
+        self.rollout_mode = rollout_mode
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self.tree = tree
+        self.max_nodes = max_nodes
+        self.array_tree = None          # Allocated on first use, and reused for every move
+        self.transpositions = TranspositionTable(transposition_size) if transposition_size > 0 else None
+        self.path = []                  # The nodes from the root to the node being searched
+        self.path_indices = []          # and the index of each of them among the children of the one before
+        self.reuse = reuse_tree
+        self.root_node = None           # The root of the previous search,
+        self.last_played = None         # and the move that was chosen there
+        self.position = None            # The position of the node being searched (see find_spot_to_expand)
+        self.threats = ThreatSearch() if threat_search else None
+        self.root_moves = None          # The moves the search chooses from at the root, when not all (see threat_move)
+        self.threat_time = threat_time
+        self.clock = TimeManager(time_tolerance, early_stop)
 
 
     def new_game(self, black_: bool):
@@ -86,6 +370,32 @@ class ChampionV2:
         will play black or white.
         """
         self.black = black_
+        self.root_node = None
+        self.last_played = None
+        if self.workers > 1:
+            self.close()
+            self.pool = self.start_workers()
+        if self.ponderer is not None:
+            self.ponderer.new_game(black_)
+
+    def new_position(self, state: GameState) -> gomoku.Position:
+        """Returns the position to search the state in, with the candidate moves and line tables as configured."""
+        return gomoku.Position.from_state(state, self.candidate_distance, self.line_tables, self.track_threats)
+
+    def start_workers(self):
+        """Starts the worker processes for the parallel search."""
+        if self.parallel == "tree":
+            return TreeParallelSearch(self.workers, self.black, self.search_options, self.search_options["max_nodes"])
+        return RootParallelPool(self.workers, self.black, self.search_options)
+
+    def close(self):
+        """Stops the worker processes of the parallel search and the pondering process, if there are any."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        if self.ponderer is not None:
+            self.ponderer.close()
+            self.ponderer = None
           
 
     def game_result(self, num_turns: int, is_black: bool) -> int:
@@ -118,6 +428,9 @@ class ChampionV2:
         
         The node is found by traversing the tree from the root node to the best child node.
         The best child node is the node with the highest UCT value.
+        self.position must be at the position of the given node; the moves on the way down are
+        played on it, so afterwards it is at the position of the returned node. The nodes on the
+        way down are appended to self.path (and their index to self.path_indices), for backup_value.
                 
         :param node: The node tree with all the game information stored in it.
         
@@ -126,26 +439,46 @@ class ChampionV2:
         Runtime complexity: O(n) Its recursive, and calls multiple functions
         """
 
-        if check_win(node.state[0], node.last_move) or len(node.valid_moves) == 0: # Return node if game is finished
+        if node.proven: # Return node if the game is finished, or its result is known
             return node
 
-        valid_moves = copy.deepcopy(node.valid_moves)
-        copied_state = copy.deepcopy(node.state)
-
-        if len(node.child_nodes) != len(valid_moves):
-            new_move = random.choice(valid_moves)
-            move_is_valid, winning_move, new_state = gomoku.move(copied_state, new_move)
-            valid_moves.remove(new_move)
-            child_node = Node(new_state, node, new_move, valid_moves)
+        if node.untried_moves is None:
+            moves = self.position.valid_moves()
+            # (with candidate moves, the moves further away are left out)
+            node.set_untried_moves(moves, self.position.ply == 1 or len(moves) == len(self.position.empty))
+
+        if len(node.untried_moves) > 0:
+            new_move = node.untried_moves.pop()
+            move_is_valid, winning_move = self.position.play(new_move)
+            child_node = None
+            if self.transpositions is not None:
+                child_node = self.transpositions.get(self.position.hash)
+            if child_node is None:
+                child_node = Node(self.position.ply, node, new_move, winning_move)
+                if self.transpositions is not None:
+                    self.transpositions.put(self.position.hash, child_node)
+            self.path.append(child_node)
+            self.path_indices.append(len(node.child_nodes))
             node.child_nodes.append(child_node)
+            node.child_moves.append(new_move)
             return child_node
 
-        return self.find_spot_to_expand(node.best_child())
+        if len(node.child_nodes) == 0: # No valid moves left: the game is a draw
+            return node
+
+        index = node.best_child_index()
+        child_node = node.child_nodes[index]
+        self.position.play(node.child_moves[index])
+        self.path.append(child_node)
+        self.path_indices.append(index)
+        return self.find_spot_to_expand(child_node)
 
     def rollout(self, node: Node) -> int:
         """
-        This function is used to simulate a random game from the current state of the game.
+        This function is used to simulate a game from the current state of the game, with the moves
+        chosen by the rollout policy (see RandomPolicy and ThreatPolicy).
         It is used to estimate the value of a node.
+        The moves are played on self.position and taken back afterwards.
         
         :param node: The leaf node that was most recently visited.
         
@@ -153,49 +486,134 @@ class ChampionV2:
 
         Runtime complexity: O(n), this function rolls out random moves untill the game is won or there are no moves left
         """
+        return self.playout(node.winning, node.parent_node is None)
+
+    def playout(self, winning: bool, at_root: bool) -> int:
+        """
+        The rollout of the current position, for search code that has no Node for it (see rollout).
+
+        :param winning: Whether the last move played on self.position won the game.
+        :param at_root: Whether self.position is the position the search started from.
+
+        :return value: The same as rollout.
+
+        Runtime complexity: O(n), this function rolls out random moves untill the game is won or there are no moves left
+        """
+        if winning:
+            return self.game_result(self.position.ply, self.black)
         
-        if check_win(node.state[0], node.last_move):
-            return self.game_result(node.state[1], self.black)
-        
-        if(node.parent_node is not None):
-            valid_moves = copy.deepcopy(node.valid_moves)
-            copied_state = copy.deepcopy(node.state)
-            random.shuffle(valid_moves)
-            
-            while len(valid_moves) > 0:
-                random_move = valid_moves.pop()
-                move_is_valid, winning_move, copied_state = gomoku.move(copied_state, random_move)
+        value = 0
+        if not at_root:
+            start_ply = self.position.ply
+            if self.policy.play(self.position):
+                value = self.game_result(self.position.ply, self.black)
+            self.position.rewind(start_ply)
+        return value
+
+    def batch_playout(self, winning: bool, at_root: bool) -> list:
+        """
+        The batched version of playout: plays self.rollouts_per_leaf random games from the current
+        position at once, with rollout_engine.batch_rollout.
 
-                if winning_move:
-                    return self.game_result(copied_state[1], self.black)                
-        return 0
+        :return values: A list with the value of each game, just like rollout returns.
 
+        Runtime complexity: O(n), one vectorized move per ply for all games together
+        """
+        if winning:
+            return [self.game_result(self.position.ply, self.black)] * self.rollouts_per_leaf
+
+        if at_root:
+            return [0] * self.rollouts_per_leaf
+
+        winners = rollout_engine.batch_rollout(self.position.state(), self.rollouts_per_leaf)
+        # black moves on the odd plies, which place colour 2 (see gomoku.move)
+        return [0 if winner == 0 else (1 if (winner == 2) == self.black else -1) for winner in winners.tolist()]
+
+    def simulate(self, winning: bool, at_root: bool) -> tuple:
+        """
+        Does the rollouts for the leaf at self.position, as configured by rollout_mode and rollouts_per_leaf.
+
+        :return: The summed value of the rollouts and the number of rollouts done.
 
-    def backup_value(self, value: float, node: Node) -> None:
+        Runtime complexity: O(n * k), k rollouts of at most n moves each
+        """
+        if self.rollout_mode == "batch":
+            values = self.batch_playout(winning, at_root)
+            return sum(values), len(values)
+        value = 0
+        for i in range(self.rollouts_per_leaf):
+            value += self.playout(winning, at_root)
+        return value, self.rollouts_per_leaf
+
+    def backup_value(self, value: float, node: Node, visits: int = 1) -> None:
         """
         This function is used to backup the value of a node in the tree.
         It is called after a simulation is run from the root to a leaf, and the value of the
         leaf node is known(see the 'move' function for more details on how values are
         assigned to leaf nodes). This value is propagated up the tree to the root, updating
-        the "N" and "Q" values of each node along the path.
-        N's are amount of visits to the node and Q's a number of accrued points.
+        the "N" and "Q" values of each node along the path (self.path, as recorded by
+        find_spot_to_expand: with transpositions a node can be reached by more than one path).
+        N's are amount of visits to the node and Q's a number of accrued points. The child_N and
+        child_Q arrays of the nodes on the path are updated as well.
 
         :param node: The leaf node that was most recently visited.
         :param value: The value of the leaf node that was most recently visited. 
         The value of a node is the value of the node's children determined by a
         win(1), draw(0.5) or loss(0)        
+        :param visits: The number of rollouts that value is the summed result of.
 
         Runtime complexity: O(n), loops over all nodes
         """
-        while node is not None:
-            node.N += 1
-            if (node.player_id != self.black):
-                node.Q = node.Q - value
-
+        path = self.path
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth]
+            node.N += visits
+            # Q is from the point of view of the player that made the move to the node
+            if (node.player_id == 1) != self.black:
+                delta = -value
             else:
-                node.Q = node.Q + value
+                delta = value
+            node.Q = node.Q + delta
+            if depth > 0:
+                parent = path[depth - 1]
+                index = self.path_indices[depth]
+                parent.child_N[index] += visits
+                parent.child_Q[index] += delta
+                if node.proven:
+                    self.prove(parent, index, node.proven)
+
+    def prove(self, parent: Node, index: int, proven: int) -> None:
+        """
+        Propagates the proven result of a child to its parent (the MCTS-Solver of Winands et al.):
+        a child that the player to move at parent wins with proves parent a loss for the player
+        that moved to it, and parent is a win for that player when all its children are lost, provided that
+        the children are all valid moves: a move that is not among them (because candidate_distance or the
+        threat search left it out) may still refute the parent.
+        The child gets a Q of +-inf in the child_Q of parent, so best_child_index skips lost children.
+
+        :param parent: The node the child is reached from.
+        :param index: The index of the child among the children of parent.
+        :param proven: The proven result of the child (see Node.proven).
+
+        Runtime complexity: O(n), with n the number of children (only for a proven loss)
+        """
+        if proven == 1:
+            parent.child_Q[index] = math.inf
+            parent.proven = -1
+        else:
+            parent.child_Q[index] = -math.inf
+            if parent.all_moves and len(parent.untried_moves) == 0 and parent.child_Q[:len(parent.child_nodes)].max() == -math.inf:
+                parent.proven = 1
 
-            node = node.parent_node
+    def proven_value(self, node: Node) -> int:
+        """
+        The value of a proven node for this player: 1 if this player wins, -1 if it loses.
+
+        Runtime complexity: O(1)
+        """
+        if (node.proven == 1) == ((node.player_id == 1) == self.black):
+            return 1
+        return -1
 
     def move(
         self, 
@@ -216,18 +634,342 @@ class ChampionV2:
 
         Runtime complexity: O(n), loops untill there is no more time left.
         """
-        
         start_time = time.time_ns()
-        valid_move_list = copy.deepcopy(valid_moves(state))
-        root_node = Node(copy.deepcopy(state), None, last_move, valid_move_list)
+        if self.ponder == "off":
+            return self.search_move(state, last_move, max_time_to_move, start_time)
+
+        if self.ponderer is None:
+            self.ponderer = Ponderer(self.black, self.search_options, self.ponder == "strict")
+        # a process that gets no CPU time (strict) may not answer in time: then search without its tree,
+        # the wait counts in the time to move since start_time
+        pondered = self.ponderer.stop(last_move, state, max_time_to_move * ChampionV2.PONDER_WAIT / 1000)
+        # the hand-over after the search counts in the time to move as well
+        chosen = self.search_move(state, last_move, max_time_to_move - self.handover_ms, start_time, pondered)
+        # ponder on from the subtree of the chosen move, which has the most visits for the likely replies
+        subtree = None
+        if self.root_node is not None and chosen == self.last_played and chosen in self.root_node.child_moves:
+            subtree = self.root_node.child_nodes[self.root_node.child_moves.index(chosen)]
+            subtree.parent_node = None
+        handover_start = time.time_ns()
+        self.ponderer.start(state, chosen, subtree)
+        self.handover_ms = max((time.time_ns() - handover_start) / 1000000, 0.9 * self.handover_ms)
+        return chosen
+
+    def search_move(self, state: GameState, last_move: Move, max_time_to_move: int, start_time: int, pondered: Node = None) -> Move:
+        """
+        The search of move.
+
+        :param start_time: The time_ns() at which move was called.
+        :param pondered: The node of state that was searched while the opponent was thinking, or None.
+        It replaces the subtree of the previous search when it has more visits.
+
+        Runtime complexity: O(n), loops untill there is no more time left.
+        """
+        valid_moves = gomoku.valid_moves(state)
+        if len(valid_moves) == 1:   # (like the first move, which has to be in the middle): nothing to search
+            self.root_node = None
+            self.last_played = (int(valid_moves[0][0]), int(valid_moves[0][1]))
+            return self.last_played
+
+        self.root_moves = None
+        if self.threats is not None:
+            forced_move, self.root_moves = self.threat_move(state, max_time_to_move * self.threat_time)
+            if forced_move is not None:
+                self.root_node = None
+                self.last_played = forced_move
+                return forced_move
+
+        if self.workers > 1:
+            return self.parallel_move(state, last_move, max_time_to_move - (time.time_ns() - start_time) / 1000000)
+
+        if self.tree == "array":
+            self.position = self.new_position(state)
+            return self.search_array(start_time, max_time_to_move)
+
+        root_node = self.reuse_tree(state, last_move) if self.reuse and self.root_moves is None else None
+        if pondered is not None and self.root_moves is None and (root_node is None or pondered.N > root_node.N):
+            self.position = self.new_position(state)
+            root_node = pondered
+            if self.transpositions is not None:
+                self.transpositions.clear()
+        if root_node is None:
+            self.position = self.new_position(state)
+            root_node = Node(state[1], None, last_move)
+            if self.root_moves is not None:
+                root_node.set_untried_moves(list(self.root_moves))
+            if self.transpositions is not None:
+                self.transpositions.clear()
+
+        # the search stops as soon as the result of the root is proven, or when the clock says so
+        self.clock.start(max_time_to_move, start_time)
+        while root_node.proven == 0:
+            self.search_iteration(root_node)
+            if self.clock.tick():
+                count = len(root_node.child_nodes)
+                contest = self.root_contest(root_node.child_N[:count], root_node.child_Q[:count])
+                if not self.clock.keep_searching(*contest, self.rollouts_per_leaf):
+                    break
+
+        self.root_node = root_node
+        # after an early stop, the move that is sure to stay the most visited one (see TimeManager)
+        self.last_played = root_node.most_visited_move() if self.clock.stopped_early else root_node.best_move()
+        return self.last_played
+
+    def search_iteration(self, root_node: Node) -> None:
+        """
+        One iteration of the search in the Node tree: finds a node to expand (see find_spot_to_expand),
+        does its rollouts and backs up their value. self.position must be at the position of root_node,
+        and is back there afterwards.
+
+        Runtime complexity: O(n * k), k rollouts of at most n moves each
+        """
+        self.path = [root_node]
+        self.path_indices = [-1]
+        leaf_node = self.find_spot_to_expand(root_node)
+        if leaf_node.proven:
+            # no rollouts needed: the result is known
+            value, visits = self.proven_value(leaf_node) * self.rollouts_per_leaf, self.rollouts_per_leaf
+        else:
+            value, visits = self.simulate(leaf_node.winning, leaf_node.parent_node is None)
+        self.backup_value(value, leaf_node, visits)
+        self.position.rewind(root_node.ply)
+
+    def threat_move(self, state: GameState, max_time_ms: float) -> tuple:
+        """
+        The threat search of move (see threat_search.ThreatSearch): looks for a forced win, and if there
+        is none, for the moves that stop a forced win of the opponent.
 
-        while (((time.time_ns() - start_time) / 1000000) < max_time_to_move):
-            leaf_node = self.find_spot_to_expand(root_node)
-            for i in range(10):
-                value = self.rollout(leaf_node)
-                self.backup_value(value, leaf_node)
+        :param max_time_ms: The time both searches may take together.
+        :return: The move to play right away (a forced win, or the only defence), or None, and the
+        moves the tree search is to choose from (the defences, if there are more), or None for all moves.
 
-        return root_node.best_move()
+        Runtime complexity: exponential in the depth of the threat search, bounded by max_time_ms
+        """
+        start_time = time.time_ns()
+        winning_move = self.threats.find_win(state, max_time_ms)
+        if winning_move is not None:
+            return winning_move, None
+        time_left_ms = max_time_ms - (time.time_ns() - start_time) / 1000000
+        if time_left_ms <= 0:  # (setting up the position of the defence search would already overrun)
+            return None, None
+        defences = self.threats.find_defences(state, time_left_ms)
+        if defences is not None and len(defences) == 1:
+            return defences[0], None
+        return None, defences or None
+
+    def parallel_move(self, state: GameState, last_move: Move, max_time_to_move: int) -> Move:
+        """
+        move for the parallel search: all workers search the state, and the move with the highest
+        Q/N over the (merged) statistics of the root children is chosen.
+
+        Runtime complexity: O(n), loops untill there is no more time left.
+        """
+        if self.pool is None:
+            self.pool = self.start_workers()
+        merged = self.pool.search(state, last_move, max(1, max_time_to_move - self.parallel_margin))
+        best_move = None
+        highest_value = -math.inf
+        for move, (N, Q) in merged.items():
+            if N > 0 and Q / N > highest_value:
+                highest_value = Q / N
+                best_move = move
+        return best_move
+
+    def root_contest(self, N, Q) -> tuple:
+        """
+        Sums up the race between the moves at the root for the TimeManager.
+
+        :param N: The visits of the root children.
+        :param Q: Their accrued points.
+        :return: The visits of the most visited child and of the second most visited one, and whether
+        the most visited child has the highest Q/N as well.
+
+        Runtime complexity: O(n), one vectorized pass over the children
+        """
+        if len(N) == 0:
+            return 0, 0, True
+        best = int(np.argmax(N))
+        second = np.partition(N, -2)[-2] if len(N) > 1 else 0
+        values = Q / np.maximum(N, 1)
+        return float(N[best]), float(second), bool(values[best] >= values.max())
+
+    def root_statistics(self) -> list:
+        """
+        Returns the statistics of the children of the root of the last search.
+
+        :return: A list of (move, N, Q) tuples.
+
+        Runtime complexity: O(n), Only loop through all children
+        """
+        if self.tree == "array":
+            tree = self.array_tree
+            size = self.position.board.size
+            first = tree.first_child[0]
+            children = range(first, first + tree.tried[0])
+            return [(divmod(int(tree.move[i]), size), int(tree.N[i]), float(tree.Q[i])) for i in children]
+        return [(move, child.N, child.Q) for child, move in zip(self.root_node.child_nodes, self.root_node.child_moves)]
+
+    def reuse_tree(self, state: GameState, last_move: Move) -> Node:
+        """
+        Looks up the node for the current state in the tree of the previous search: the child for the
+        move that was played there, and then its child for the opponent's last_move.
+        The statistics gathered in that subtree are kept; the rest of the old tree is dropped.
+
+        :param state: GameState object with the current state of the game.
+        :param last_move: Move object with the last move that was made.
+
+        :return: The node for state, with self.position at its position, or None if the previous
+        search does not lead to state (for example in a new game).
+
+        Runtime complexity: O(n), looks up two moves among the children and hashes the board.
+        """
+        node = self.root_node
+        if node is None or self.position is None or last_move is None or len(last_move) != 2:
+            return None
+
+        self.position.rewind(node.ply)
+        for move in (self.last_played, (int(last_move[0]), int(last_move[1]))):
+            if move not in node.child_moves:
+                return None
+            node = node.child_nodes[node.child_moves.index(move)]
+            self.position.play(move)
+
+        if self.position.ply != state[1] or self.position.hash != gomoku.zobrist_hash(state[0]):
+            return None
+
+        node.parent_node = None
+        return node
+
+    def find_spot_to_expand_array(self, tree: ArrayTree, lock = None) -> int:
+        """
+        find_spot_to_expand for the array tree: walks down from the root (node 0) to the node to expand,
+        playing the moves on the way on self.position, which must be at the root position.
+
+        :param tree: The array tree to search in.
+        :param lock: For a tree that is shared between processes: the lock that guards its expansion.
+        Every node on the way down then gets a virtual loss (see add_virtual_loss).
+
+        :return node: The index of the node that is to be expanded.
+
+        Runtime complexity: O(n), with n the depth of the tree
+        """
+        size = self.position.board.size
+        node = 0
+        if lock is not None:
+            self.add_virtual_loss(tree, node)
+        while True:
+            if tree.winning[node]: # Return node if game is finished
+                return node
+
+            if not tree.expanded[node] or tree.tried[node] < tree.child_count[node]:
+                if lock is None:
+                    child = self.expand_array(tree, node, size)
+                else:
+                    with lock:
+                        child = self.expand_array(tree, node, size)
+                    if child != node and child >= 0:
+                        self.add_virtual_loss(tree, child)
+                if child >= 0:
+                    return child
+
+            if tree.child_count[node] == 0: # No valid moves left: the game is a draw
+                return node
+
+            node = tree.best_child(node)
+            if lock is not None:
+                self.add_virtual_loss(tree, node)
+            self.position.play(divmod(int(tree.move[node]), size))
+
+    def expand_array(self, tree: ArrayTree, node: int, size: int) -> int:
+        """
+        Expands the next untried child of a node in the array tree (allocating the children first, if needed),
+        and plays its move on self.position.
+
+        :return: The new child, the node itself if the tree is full, or -1 if all children have been tried.
+
+        Runtime complexity: O(n), with n the number of valid moves (only when the children are allocated)
+        """
+        if not tree.expanded[node]:
+            moves = self.root_moves if node == 0 and self.root_moves is not None else self.position.valid_moves()
+            moves = [row * size + col for (row, col) in moves]
+            random.shuffle(moves)
+            if not tree.add_children(node, moves): # The tree is full: just do rollouts from here
+                return node
+
+        tried = tree.tried[node]
+        if tried < tree.child_count[node]:
+            child = tree.first_child[node] + tried
+            tree.tried[node] = tried + 1
+            move_is_valid, winning_move = self.position.play(divmod(int(tree.move[child]), size))
+            tree.winning[child] = winning_move
+            return child
+        return -1
+
+    def add_virtual_loss(self, tree: ArrayTree, node: int) -> None:
+        """
+        Counts a lost visit for a node that a search process is about to roll out below, such that the
+        other processes that share the tree prefer different paths. backup_value_array takes it back.
+
+        Runtime complexity: O(1)
+        """
+        tree.N[node] += 1
+        tree.Q[node] -= 1   # a loss for the player that made the move to the node
+
+    def backup_value_array(self, value: float, tree: ArrayTree, node: int, visits: int = 1, virtual_loss: bool = False) -> None:
+        """
+        backup_value for the array tree, with self.position at the position of the given node.
+        With virtual_loss, the virtual losses of the nodes on the path are taken back as well.
+
+        Runtime complexity: O(n), loops over all nodes on the path to the root
+        """
+        ply = self.position.ply
+        while node >= 0:
+            if virtual_loss:
+                tree.N[node] += visits - 1
+                tree.Q[node] += 1
+            else:
+                tree.N[node] += visits
+            player_id = 1 if (ply % 2 == 0) else 2
+            if (player_id == 1) != self.black:
+                tree.Q[node] -= value
+            else:
+                tree.Q[node] += value
+            node = tree.parent[node]
+            ply -= 1
+
+    def search_array(self, start_time: int, max_time_to_move: int, tree: ArrayTree = None, lock = None) -> Move:
+        """
+        The main loop of move, on the array tree instead of on Node objects.
+        By default the player searches its own tree, from scratch. A tree-parallel search worker passes the
+        tree that it shares with the other workers (see TreeParallelSearch), which is not reset here.
+
+        Runtime complexity: O(n), loops untill there is no more time left.
+        """
+        if tree is None:
+            if self.array_tree is None:
+                self.array_tree = ArrayTree(self.max_nodes)
+            tree = self.array_tree
+            tree.reset()
+        root_ply = self.position.ply
+
+        self.clock.start(max_time_to_move, start_time)
+        while True:
+            leaf_node = self.find_spot_to_expand_array(tree, lock)
+            value, visits = self.simulate(bool(tree.winning[leaf_node]), leaf_node == 0)
+            self.backup_value_array(value, tree, leaf_node, visits, lock is not None)
+            self.position.rewind(root_ply)
+            if self.clock.tick():
+                first = tree.first_child[0]
+                children = slice(first, first + tree.tried[0])
+                contest = self.root_contest(tree.N[children], tree.Q[children])
+                if not self.clock.keep_searching(*contest, self.rollouts_per_leaf):
+                    break
+
+        best_move = tree.most_visited_move() if self.clock.stopped_early else tree.best_move()
+        if best_move < 0:
+            # the root was never expanded (the tree is too small, or the time was up): any move it could choose
+            return random.choice(self.root_moves if self.root_moves is not None else self.position.valid_moves())
+        return divmod(best_move, self.position.board.size)
 
     def id(self) -> str:
         """Please return a string here that uniquely identifies your submission e.g., "name (student_id)" """
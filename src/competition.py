@@ -5,10 +5,14 @@ from random_agent import random_dummy_player
 from gomoku_ai_marius1_webclient import gomoku_ai_marius1_webclient
 from gomoku_ai_random_webclient import gomoku_ai_random_webclient
 
-from champion import Champion
+from champion_v2 import ChampionV2
+from process_player import ProcessPlayer, MoveTimeout
 
+import math
+import os
 import random
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 
 class Competition:
@@ -17,92 +21,101 @@ class Competition:
     methods implemented. Players are registered one by one using the register_player method.
     The competition is started using the play_competition method."""
 
-    def __init__(self, bsize_=19):
-        """Initialises the competition. The board size (default 19) for the entire competition can be set here."""
+    def __init__(self, bsize_=19, store=None):
+        """Initialises the competition. The board size (default 19) for the entire competition can be set here.
+        With a store (a CompetitionStore), every finished game is saved right away, and a competition
+        that is played again skips the games that are already in the store."""
         self.players = []
         self.results = []
         self.bsize = bsize_
+        self.store = store
+        self.latencies = []
 
     def register_player(self, player_):
         """This method registers an AI player that the students have implemented.
         This player needs to be in a separate file."""
         self.players.append(player_)
 
-    def play_competition(self, maxtime_per_move=1000, tolerance=0.05):
+    def play_competition(
+        self,
+        maxtime_per_move=1000,
+        tolerance=0.05,
+        games_per_pair=1,
+        parallel=False,
+        isolate_players=False,
+        on_timeout="forfeit",
+    ):
         """This method runs the actual competition between the registered players.
-        Each player plays each other player twice: once with black and once with white."""
+        Each player plays each other player twice: once with black and once with white.
+        With games_per_pair > 1, each of those pairings is played that many times.
+        With parallel, the games are played at the same time in a pool of worker processes
+        (see concurrent_games). This gives the same results matrix as playing them one after another.
+        With a store, the results matrix covers all games in the store.
+        With isolate_players, every player runs in a subprocess of its own (see ProcessPlayer), which is
+        stopped when it exceeds maxtime_per_move * (1 + tolerance). on_timeout tells what happens then:
+        "forfeit" loses the game, "random" plays a random move instead.
+        The time each move took is kept in a histogram per player (see print_latencies)."""
         self.results = []
-        mtime = (
-            maxtime_per_move * (1.0 + tolerance) * 1000000
-        )  # operational maxtime in nanoseconds
         for i in range(len(self.players)):
             self.results.append(
                 [0.0] * len(self.players)
             )  # set the results matrix to all zeroes
-        for i in range(len(self.players)):
-            for j in range(len(self.players)):
-                if i == j:
-                    continue  # players do not play themselves
-                self.players[i].new_game(True)  # player i is black
-                self.players[j].new_game(False)  # player j is white
-                game = gomoku.starting_state(bsize_=self.bsize)  # initialise the game
-                previous_move = ()
-                over = False
-                while not over:
-                    if game[1] % 2 == 1:  # black to move
-                        current_player = self.players[i]
-                        pid = i
-                        pid_other = j
-                    else:  # white to move
-                        current_player = self.players[j]
-                        pid = j
-                        pid_other = i
-                    random.seed(
-                        time.time_ns()
-                    )  # just in case the other player has tinkered with random.seed.
-                    start_time = time.time_ns()
-                    move = current_player.move(
-                        game, previous_move, max_time_to_move=maxtime_per_move
-                    )
-                    stop_time = time.time_ns()
-                    # print(str((stop_time-start_time)/1000000)+"/"+str(maxtime_per_move*(1+tolerance)))
-                    ok, win, game = gomoku.move(
-                        game, move
-                    )  # perform the move, and obtain whether the move was valid (ok) and whether the move results in a win
-                    previous_move = move
-                    # Uncomment the follwing two lines if you want to watch the games unfold slowly:
-                    # time.sleep(1)
-                    # gomoku.pretty_board(game[0])
-                    if (stop_time - start_time) > mtime:
-                        # player who made the illegal move should be disqualified. This needs to be done manually.
-                        print(
-                            "disqualified for exceeding maximum time per move: player "
-                            + str(pid)
-                        )
-                    if not ok:
-                        # player who made the illegal move should be disqualified. This needs to be done manually.
-                        print("disqualified for illegal move: player " + str(pid))
-                        print("on board: ")
-                        gomoku.pretty_board(game[0])
-                        print(
-                            "trying to play: ("
-                            + str(move[0])
-                            + ","
-                            + str(move[1])
-                            + ")"
-                        )
-                        if game[1] % 2 == 1:
-                            print("as black")
-                        else:
-                            print("as white")
-                    if win:
-                        over = True
-                        self.results[pid][pid_other] += 1
-                    elif len(gomoku.valid_moves(game)) == 0:
-                        # if there are no more valid moves, the board is full and it's a draw
-                        over = True
-                        self.results[pid][pid_other] += 0.5
-                        self.results[pid_other][pid] += 0.5
+        self.latencies = [LatencyHistogram() for player in self.players]
+        players = self.players
+        if isolate_players:
+            players = [ProcessPlayer(player, 1.0 + tolerance) for player in self.players]
+        jobs = [
+            (i, j, k)
+            for i in range(len(self.players))
+            for j in range(len(self.players))
+            if i != j  # players do not play themselves
+            for k in range(games_per_pair)
+        ]
+        if self.store is not None:
+            self.store.register_players([player.id() for player in self.players])
+            finished = self.store.finished_games()
+            jobs = [job for job in jobs if job not in finished]
+        if parallel:
+            with ProcessPoolExecutor(
+                max_workers=self.concurrent_games(),
+                initializer=_init_worker,
+                initargs=(players, self.bsize, maxtime_per_move, tolerance, on_timeout),
+            ) as pool:
+                futures = [pool.submit(_play_job, job) for job in jobs]
+                for future in as_completed(futures):
+                    self.add_result(*future.result())
+        else:
+            for i, j, k in jobs:
+                score, moves, times = play_game(
+                    players, i, j, self.bsize, maxtime_per_move, tolerance, on_timeout
+                )
+                self.add_result(i, j, k, score, moves, times)
+        if isolate_players:
+            for player in players:
+                player.close()
+        if self.store is not None:
+            self.results = self.store.results(len(self.players))
+
+    def add_result(self, i, j, k, score, moves, times):
+        """Adds the score of black (1 for a win, 0.5 for a draw and 0 for a loss) of game k
+        between player i (black) and player j (white) to the results matrix, and saves the game in the store."""
+        self.results[i][j] += score
+        self.results[j][i] += 1 - score
+        self.latencies[i].add(times[0::2])  # black moves first
+        self.latencies[j].add(times[1::2])
+        if self.store is not None:
+            self.store.add_game(i, j, k, self.bsize, score, moves, times)
+
+    def concurrent_games(self):
+        """The number of games that the parallel competition plays at the same time: the available
+        cores divided by the cores that one player uses (a player with worker processes of its own
+        can tell how many cores it uses in its cores attribute, the default is 1)."""
+        if hasattr(os, "sched_getaffinity"):
+            available = len(os.sched_getaffinity(0))
+        else:
+            available = os.cpu_count() or 1
+        per_game = max([getattr(player, "cores", 1) for player in self.players] + [1])
+        return max(1, available // per_game)
 
     def print_scores(self):
         """This method prints the results of the competition to sysout"""
@@ -113,24 +126,160 @@ class Competition:
             print("[" + self.players[i].id() + ", " + str(sum(line)) + "]")
             i += 1
 
+    def print_latencies(self):
+        """This method prints the histogram of the time per move of each player to sysout"""
+        for player, histogram in zip(self.players, self.latencies):
+            print("[" + player.id() + "]")
+            histogram.print()
+
+
+class LatencyHistogram:
+    """The times per move of a player, counted in buckets that double in size: up to 1 ms, 1-2 ms, 2-4 ms, etc."""
+
+    BUCKETS = 20
+
+    def __init__(self):
+        self.counts = [0] * LatencyHistogram.BUCKETS
+        self.total = 0  # in nanoseconds
+        self.longest = 0
+
+    def add(self, times):
+        """Counts the given times (in nanoseconds)."""
+        for t in times:
+            bucket = 0 if t <= 1000000 else math.ceil(math.log2(t / 1000000))
+            self.counts[min(bucket, LatencyHistogram.BUCKETS - 1)] += 1
+            self.total += t
+            self.longest = max(self.longest, t)
+
+    def count(self):
+        return sum(self.counts)
+
+    def print(self):
+        count = self.count()
+        if count == 0:
+            print("no moves")
+            return
+        print(
+            "moves: " + str(count)
+            + ", mean: " + str(round(self.total / count / 1000000, 1)) + " ms"
+            + ", max: " + str(round(self.longest / 1000000, 1)) + " ms"
+        )
+        for bucket, n in enumerate(self.counts):
+            if n > 0:
+                print("  <= " + str(1 << bucket).rjust(7) + " ms: " + str(n))
+
+
+def play_game(players, i, j, bsize, maxtime_per_move=1000, tolerance=0.05, on_timeout="forfeit"):
+    """Plays one game between player i (black) and player j (white) of the given players.
+    Returns the score of black (1 for a win, 0.5 for a draw and 0 for a loss),
+    the moves played and the time each move took in nanoseconds.
+    A player that raises MoveTimeout (see ProcessPlayer, whose player may also have crashed) loses the game
+    if on_timeout is "forfeit", and gets a random move played for it if on_timeout is "random"."""
+    mtime = (
+        maxtime_per_move * (1.0 + tolerance) * 1000000
+    )  # operational maxtime in nanoseconds
+    players[i].new_game(True)  # player i is black
+    players[j].new_game(False)  # player j is white
+    game = gomoku.starting_state(bsize_=bsize)  # initialise the game
+    previous_move = ()
+    moves = []
+    times = []
+    while True:
+        if game[1] % 2 == 1:  # black to move
+            current_player = players[i]
+            pid = i
+        else:  # white to move
+            current_player = players[j]
+            pid = j
+        random.seed(
+            time.time_ns()
+        )  # just in case the other player has tinkered with random.seed.
+        start_time = time.time_ns()
+        timed_out = False
+        try:
+            move = current_player.move(
+                game, previous_move, max_time_to_move=maxtime_per_move
+            )
+        except MoveTimeout as error:
+            print("stopped: " + str(error) + ": player " + str(pid))
+            if on_timeout == "forfeit":
+                return (0.0 if pid == i else 1.0), moves, times
+            move = random.choice(gomoku.valid_moves(game))
+            timed_out = True
+        stop_time = time.time_ns()
+        # print(str((stop_time-start_time)/1000000)+"/"+str(maxtime_per_move*(1+tolerance)))
+        ok, win, game = gomoku.move(
+            game, move
+        )  # perform the move, and obtain whether the move was valid (ok) and whether the move results in a win
+        previous_move = move
+        moves.append(move)
+        times.append(stop_time - start_time)
+        # Uncomment the follwing two lines if you want to watch the games unfold slowly:
+        # time.sleep(1)
+        # gomoku.pretty_board(game[0])
+        if (stop_time - start_time) > mtime and not timed_out:
+            # player who made the illegal move should be disqualified. This needs to be done manually.
+            print(
+                "disqualified for exceeding maximum time per move: player "
+                + str(pid)
+            )
+        if not ok:
+            # player who made the illegal move should be disqualified. This needs to be done manually.
+            print("disqualified for illegal move: player " + str(pid))
+            print("on board: ")
+            gomoku.pretty_board(game[0])
+            print(
+                "trying to play: ("
+                + str(move[0])
+                + ","
+                + str(move[1])
+                + ")"
+            )
+            if game[1] % 2 == 1:
+                print("as black")
+            else:
+                print("as white")
+        if win:
+            return (1.0 if pid == i else 0.0), moves, times
+        elif len(gomoku.valid_moves(game)) == 0:
+            # if there are no more valid moves, the board is full and it's a draw
+            return 0.5, moves, times
+
+
+# The state of a worker process of the parallel competition: its own copies of the players, and the game settings
+_worker = None
+
+
+def _init_worker(players, bsize, maxtime_per_move, tolerance, on_timeout):
+    global _worker
+    _worker = (players, bsize, maxtime_per_move, tolerance, on_timeout)
+
+
+def _play_job(job):
+    """Plays game k of player i (black) against player j (white) in a worker process."""
+    i, j, k = job
+    players, bsize, maxtime_per_move, tolerance, on_timeout = _worker
+    return (i, j, k) + play_game(players, i, j, bsize, maxtime_per_move, tolerance, on_timeout)
+
 
 # Now follows the main script for running the competition
 # At present the competition consists of just three random dummy players playing each other
 # When the students submit a player file, they should be entered one by one.
-game = gomoku.starting_state()
-
-# player0 = random_dummy_player()
-player3 = gomoku_ai_marius1_webclient()
-player1 = Champion()
-player2 = gomoku_ai_random_webclient()
-
-comp = Competition()
-comp.register_player(player1)
-# comp.register_player(player2)
-comp.register_player(player3)
+if __name__ == "__main__":
+    # player0 = random_dummy_player()
+    player3 = gomoku_ai_marius1_webclient()
+    player1 = ChampionV2()
+    player2 = gomoku_ai_random_webclient()
 
+    comp = Competition()
+    # To save the games as they finish, and skip them when the competition is started again:
+    # from competition_store import CompetitionStore
+    # comp = Competition(store=CompetitionStore("competition.sqlite"))
+    comp.register_player(player1)
+    # comp.register_player(player2)
+    comp.register_player(player3)
 
-nofCompetitions = 1
-for i in range(nofCompetitions):
-    comp.play_competition()
-    comp.print_scores()
+    nofCompetitions = 1
+    for i in range(nofCompetitions):
+        comp.play_competition()
+        comp.print_scores()
@@ -0,0 +1,118 @@
+# A persistent store for the games of a competition, so that a competition that is stopped
+# (or crashes) halfway can be continued without playing the finished games again.
+
+import sqlite3
+import time
+from array import array
+
+
+class CompetitionStore:
+    """
+    Keeps the finished games of a competition in an SQLite database, one row per game, written as
+    soon as the game is over. A game row holds the players (by their place in the competition), the
+    index of the game within its pairing, the score of black, the moves and the time each move took.
+    The moves and the times are packed into blobs: 2 bytes per move and 4 bytes per time (in microseconds).
+
+    The players table records which player had which place, so a store cannot be continued
+    with another line-up of players by accident.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS players (
+            place INTEGER PRIMARY KEY,
+            name TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS games (
+            black INTEGER NOT NULL REFERENCES players(place),
+            white INTEGER NOT NULL REFERENCES players(place),
+            game_index INTEGER NOT NULL,
+            bsize INTEGER NOT NULL,
+            score REAL NOT NULL,
+            moves BLOB NOT NULL,
+            times BLOB NOT NULL,
+            finished REAL NOT NULL,
+            PRIMARY KEY (black, white, game_index)
+        );
+        CREATE INDEX IF NOT EXISTS games_white ON games (white, black);
+    """
+
+    def __init__(self, path: str = "competition.sqlite"):
+        """
+        :param path: The file of the database. It is created if it does not exist yet.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(CompetitionStore.SCHEMA)
+
+    def register_players(self, names: list):
+        """
+        Records the names of the players of the competition, in order.
+        For an existing store, the names must be the same as the ones it was created with.
+        """
+        stored = self.connection.execute("SELECT name FROM players ORDER BY place").fetchall()
+        if not stored:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT INTO players (place, name) VALUES (?, ?)", enumerate(names)
+                )
+        elif [name for (name,) in stored] != list(names):
+            raise ValueError(
+                "the players of the competition differ from the players in " + self.path
+                + ": " + str([name for (name,) in stored])
+            )
+
+    def add_game(self, black: int, white: int, game_index: int, bsize: int, score: float, moves: list, times: list):
+        """
+        Stores a finished game, and commits it right away.
+
+        :param black: The place of the black player.
+        :param white: The place of the white player.
+        :param game_index: The index of the game within the pairing.
+        :param score: The score of black: 1 for a win, 0.5 for a draw and 0 for a loss.
+        :param moves: The moves of the game, in order.
+        :param times: The time each move took, in nanoseconds.
+        """
+        packed_moves = bytes(int(x) for move in moves for x in move)
+        packed_times = array("I", (min(t // 1000, 0xFFFFFFFF) for t in times)).tobytes()
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (black, white, game_index, bsize, score, packed_moves, packed_times, time.time()),
+            )
+
+    def finished_games(self) -> set:
+        """Returns the (black, white, game_index) triples of the games in the store."""
+        return set(self.connection.execute("SELECT black, white, game_index FROM games"))
+
+    def game(self, black: int, white: int, game_index: int):
+        """
+        Returns the score, the moves and the move times (in microseconds) of a stored game, or None.
+        """
+        row = self.connection.execute(
+            "SELECT score, moves, times FROM games WHERE black = ? AND white = ? AND game_index = ?",
+            (black, white, game_index),
+        ).fetchone()
+        if row is None:
+            return None
+        score, packed_moves, packed_times = row
+        moves = [(packed_moves[i], packed_moves[i + 1]) for i in range(0, len(packed_moves), 2)]
+        times = array("I")
+        times.frombytes(packed_times)
+        return score, moves, times.tolist()
+
+    def results(self, nof_players: int) -> list:
+        """
+        Computes the results matrix of Competition from the store: entry [i][j] holds the points
+        player i scored against player j, with either colour.
+        """
+        results = [[0.0] * nof_players for i in range(nof_players)]
+        rows = self.connection.execute(
+            "SELECT black, white, SUM(score), COUNT(*) FROM games GROUP BY black, white"
+        )
+        for black, white, score, count in rows:
+            results[black][white] += score
+            results[white][black] += count - score
+        return results
+
+    def close(self):
+        self.connection.close()
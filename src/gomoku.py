@@ -3,6 +3,7 @@
 
 import numpy as np
 import itertools
+import random
 from typing import Tuple, List
 
 # Simple Data Types to define the game with
@@ -17,15 +18,122 @@ Move = Tuple[int, int]  # location on the board: (row, col)
 SIZE = 7 #7
 
 
-def starting_state(bsize_: int = SIZE) -> GameState:
+class BitBoard:
+    """
+    Alternative board representation: one Python int per colour (bitboard).
+    Cell (row, col) is bit row * (size + 1) + col. The extra column at the end of each row is
+    always empty, so shifting a bitboard horizontally or diagonally never wraps a line of stones
+    around to the next row.
+    The stones of colour 1 and 2 are in stones[1] and stones[2] (stones[0] is unused), such that
+    the colour values match the ones used on the numpy board.
+    """
+
+    __slots__ = ("size", "stride", "stones")
+
+    def __init__(self, size: int = SIZE):
+        self.size = size
+        self.stride = size + 1
+        self.stones = [0, 0, 0]
+
+    def index(self, move: Move) -> int:
+        """Returns the bit index of a (row, col) location."""
+        return move[0] * self.stride + move[1]
+
+    def colour_at(self, move: Move) -> int:
+        """Returns 0 (empty), 1 or 2, just like board[row][col] on a numpy board."""
+        bit = 1 << (move[0] * self.stride + move[1])
+        if self.stones[1] & bit:
+            return 1
+        if self.stones[2] & bit:
+            return 2
+        return 0
+
+    def empty_cells(self) -> int:
+        """Returns a bitboard with the empty cells of the board set."""
+        return _board_mask(self.size) & ~(self.stones[1] | self.stones[2])
+
+    def __deepcopy__(self, memo):
+        clone = BitBoard(self.size)
+        clone.stones = self.stones[:]
+        return clone
+
+
+_BOARD_MASKS = {}
+
+
+def _board_mask(size: int) -> int:
+    """Returns (and caches) the bitboard with all cells of a size by size board set."""
+    mask = _BOARD_MASKS.get(size)
+    if mask is None:
+        row = (1 << size) - 1
+        mask = 0
+        for r in range(size):
+            mask |= row << (r * (size + 1))
+        _BOARD_MASKS[size] = mask
+    return mask
+
+
+def starting_state(bsize_: int = SIZE, bitboard: bool = False) -> GameState:
     """
     Creates a new game (start state of the game) as a square 2-dimensional numpy array of bytes (int8)
     :param bsize_: the size of the board
+    :param bitboard: when True, the board is a BitBoard instead of a numpy array
     :return: a new empty board, on the first ply (half-move) to make
     """
+    if bitboard:
+        return BitBoard(bsize_), 1
     return np.zeros((bsize_, bsize_), dtype=np.int8), 1
 
 
+def to_bitboard(board: Board) -> BitBoard:
+    """
+    Converts a numpy board (or a list of lists) to a BitBoard.
+    :param board: a square board, 0 being empty, 1 and 2 stones of either colour
+    :return: the same position as a BitBoard
+    """
+    board = np.asarray(board)
+    size = np.shape(board)[0]
+    result = BitBoard(size)
+    # add the (empty) padding column, such that the row-major cell order matches the bit order
+    padded = np.zeros((size, size + 1), dtype=np.int8)
+    padded[:, :size] = board
+    for colour in (1, 2):
+        packed = np.packbits(padded == colour, bitorder="little")
+        result.stones[colour] = int.from_bytes(packed.tobytes(), "little")
+    return result
+
+
+def to_numpy(bitboard: BitBoard) -> Board:
+    """
+    Converts a BitBoard to a numpy board.
+    :param bitboard: the board to convert
+    :return: a square 2-dimensional numpy array of bytes (int8)
+    """
+    size = bitboard.size
+    ncells = size * bitboard.stride
+    board = np.zeros(ncells, dtype=np.int8)
+    nbytes = (ncells + 7) // 8
+    for colour in (1, 2):
+        raw = np.frombuffer(bitboard.stones[colour].to_bytes(nbytes, "little"), dtype=np.uint8)
+        bits = np.unpackbits(raw, bitorder="little")[:ncells]
+        board[bits == 1] = colour
+    return board.reshape(size, bitboard.stride)[:, :size].copy()
+
+
+def state_to_bitboard(state: GameState) -> GameState:
+    """Returns the game state with its board converted to a BitBoard (if it isn't one already)."""
+    if isinstance(state[0], BitBoard):
+        return state
+    return to_bitboard(state[0]), state[1]
+
+
+def state_to_numpy(state: GameState) -> GameState:
+    """Returns the game state with its board converted to a numpy array (if it isn't one already)."""
+    if isinstance(state[0], BitBoard):
+        return to_numpy(state[0]), state[1]
+    return state
+
+
 def valid_moves(state: GameState) -> List[Move]:
     """
     A function to check which moves are available to the agent.
@@ -35,6 +143,8 @@ def valid_moves(state: GameState) -> List[Move]:
     """
     board = state[0]
     ply = state[1]
+    if isinstance(board, BitBoard):
+        return _bitboard_valid_moves(board, ply)
     if ply == 1:
         middle = np.array(np.shape(board)) // 2
         return [tuple(middle)]
@@ -49,6 +159,21 @@ def valid_moves(state: GameState) -> List[Move]:
         return list(zip(*np.where(board == 0)))
 
 
+def _bitboard_valid_moves(board: BitBoard, ply: int) -> List[Move]:
+    """valid_moves for a BitBoard: the empty cells in row-major order (the same order as np.where)."""
+    if ply == 1:
+        middle = board.size // 2
+        return [(middle, middle)]
+    moves = []
+    empty = board.empty_cells()
+    stride = board.stride
+    while empty:
+        lowest = empty & -empty
+        moves.append(divmod(lowest.bit_length() - 1, stride))
+        empty ^= lowest
+    return moves
+
+
 def check_win(board: Board, last_move: Move) -> bool:
     if last_move == None or last_move == ():
         return False
@@ -56,6 +181,8 @@ def check_win(board: Board, last_move: Move) -> bool:
     """This method checks whether the last move played wins the game.
     The rule for winning is: /exactly/ 5 stones line up (so not 6 or more),
     horizontally, vertically, or diagonally."""
+    if isinstance(board, BitBoard):
+        return _bitboard_check_win(board, last_move)
     color = board[last_move[0]][last_move[1]]
     bsize = np.shape(board)[0]
     # check up-down
@@ -143,6 +270,47 @@ def check_win(board: Board, last_move: Move) -> bool:
     return False
 
 
+def _bitboard_check_win(board: BitBoard, last_move: Move) -> bool:
+    """check_win for a BitBoard, using shift-and-mask five-in-a-row detection."""
+    colour = board.colour_at(last_move)
+    if colour == 0:
+        return False
+    stones = board.stones[colour]
+    index = board.index(last_move)
+    # the four directions: left-right, up-down and the two diagonals
+    for step in (1, board.stride, board.stride + 1, board.stride - 1):
+        if _exact_five_through(stones, index, step):
+            return True
+    return False
+
+
+def _exact_five_through(stones: int, index: int, step: int) -> bool:
+    """
+    Checks whether the bit at index is part of a line of /exactly/ 5 stones in the given direction.
+    :param stones: the bitboard of one colour
+    :param index: the bit index of the stone that must be part of the line
+    :param step: the bit distance between two neighbouring cells in the direction to check
+    """
+    # bit p of fives is set when the bits p, p+step, .., p+4*step are all set
+    fives = (
+        stones
+        & (stones >> step)
+        & (stones >> 2 * step)
+        & (stones >> 3 * step)
+        & (stones >> 4 * step)
+    )
+    # drop the lines that are preceded or followed by a sixth stone
+    fives &= ~(stones << step) & ~(stones >> 5 * step)
+    if not fives:
+        return False
+    # a line through index starts at most 4 steps before it
+    for k in range(5):
+        start = index - k * step
+        if start >= 0 and (fives >> start) & 1:
+            return True
+    return False
+
+
 def move(state: GameState, move: Move) -> Tuple[bool, bool, GameState]:
     """
     A function to get to a new state when playing a move
@@ -153,6 +321,8 @@ def move(state: GameState, move: Move) -> Tuple[bool, bool, GameState]:
     board = state[0]
     ply = state[1]
     colour = 2 if ply % 2 else 1
+    if isinstance(board, BitBoard):
+        return _bitboard_move(board, ply, colour, move)
     if board[move[0]][move[1]] == 0:
         if ply in [
             1,
@@ -169,11 +339,344 @@ def move(state: GameState, move: Move) -> Tuple[bool, bool, GameState]:
         return False, False, state
 
 
+def _bitboard_move(
+    board: BitBoard, ply: int, colour: int, move: Move
+) -> Tuple[bool, bool, GameState]:
+    """move for a BitBoard. Just like the numpy version, the board is updated in place."""
+    if not (0 <= move[0] < board.size and 0 <= move[1] < board.size):
+        return False, False, (board, ply)
+    if board.colour_at(move) != 0:
+        return False, False, (board, ply)
+    if ply == 1 and move != (board.size // 2, board.size // 2):
+        return False, False, (board, ply)
+    board.stones[colour] |= 1 << board.index(move)
+    return True, _bitboard_check_win(board, move), (board, ply + 1)
+
+
+_ZOBRIST_KEYS = {}
+
+
+def zobrist_keys(bsize_: int) -> List[List[int]]:
+    """
+    Returns (and caches) the random 64-bit Zobrist keys for a board size.
+    keys[colour][index] is the key of a stone of that colour (1 or 2) on the cell with the given
+    BitBoard bit index (row * (bsize_ + 1) + col). The keys come from a fixed seed, so every
+    process computes the same hashes for the same position.
+    """
+    keys = _ZOBRIST_KEYS.get(bsize_)
+    if keys is None:
+        rng = random.Random(bsize_)
+        ncells = bsize_ * (bsize_ + 1)
+        keys = [[0] * ncells] + [[rng.getrandbits(64) for i in range(ncells)] for colour in (1, 2)]
+        _ZOBRIST_KEYS[bsize_] = keys
+    return keys
+
+
+def zobrist_hash(board: Board) -> int:
+    """
+    Computes the Zobrist hash of a board (numpy or BitBoard): the xor of the keys of all its stones.
+    Position maintains the same hash incrementally.
+    """
+    if not isinstance(board, BitBoard):
+        board = to_bitboard(board)
+    keys = zobrist_keys(board.size)
+    result = 0
+    for colour in (1, 2):
+        stones = board.stones[colour]
+        while stones:
+            lowest = stones & -stones
+            result ^= keys[colour][lowest.bit_length() - 1]
+            stones ^= lowest
+    return result
+
+
+class LineTable:
+    """
+    Incremental directional line lengths, for constant time win checks.
+    For each of the 4 directions, runs[d][i] holds the length of the line of same-coloured stones
+    through cell i in direction d. It is kept up to date at the two ends of every line, which are the
+    only cells that are ever read: a stone placed on an empty cell can only extend or join the lines
+    that end next to it. So placing a stone updates 2 entries per direction, and the lengths
+    are saved on an undo stack to take it back.
+    Cells are BitBoard bit indices, shifted by a margin of off-board cells (colour -1) around the board,
+    such that the neighbours of a cell never need a bounds check.
+
+    With track_threats, the table also keeps the threats: threats[colour] is the set of (bit indices of)
+    empty cells where a stone of that colour would win. Only the cells just beyond the ends of the lines
+    through a new stone can start or stop being a threat, so they are the only ones checked again.
+    That costs several times as much as the line lengths themselves, so it is only done on request.
+    """
+
+    def __init__(self, bsize_: int = SIZE, track_threats: bool = False):
+        self.size = bsize_
+        self.track_threats = track_threats
+        stride = bsize_ + 1
+        self.margin = stride + 1
+        ncells = bsize_ * stride + 2 * self.margin
+        self.steps = (1, stride, stride + 1, stride - 1)
+        self.colour = [-1] * ncells
+        for row in range(bsize_):
+            for col in range(bsize_):
+                self.colour[row * stride + col + self.margin] = 0
+        self.runs = [[0] * ncells for step in self.steps]
+        self.threats = [None, set(), set()]  # (empty unless track_threats)
+        self.changes = []  # the undo stack: per stone, the saved line lengths and the threats that changed
+
+    def place(self, index: int, colour: int) -> bool:
+        """
+        Places a stone on the (empty) cell with the given BitBoard bit index.
+        :return: whether the stone is part of a line of /exactly/ 5
+        """
+        i = index + self.margin
+        colours = self.colour
+        colours[i] = colour
+        saved = []
+        win = False
+        for runs, step in zip(self.runs, self.steps):
+            left = runs[i - step] if colours[i - step] == colour else 0
+            right = runs[i + step] if colours[i + step] == colour else 0
+            start = i - left * step
+            end = i + right * step
+            saved.append((start, runs[start], end, runs[end]))
+            length = left + 1 + right
+            runs[start] = length
+            runs[end] = length
+            if length == 5:
+                win = True
+        self.changes.append((i, saved, self.update_threats(index, colour, saved) if self.track_threats else None))
+        return win
+
+    def update_threats(self, index: int, colour: int, saved: list) -> list:
+        """
+        Updates the threats after a stone of the given colour was placed on the cell with the given bit index.
+        :param saved: the ends of the lines through the stone, per direction (as saved by place)
+        :return: the (colour, index) pairs that were added to or removed from the threats
+        """
+        colours = self.colour
+        threats = self.threats
+        flipped = []
+        for c in (1, 2):
+            if index in threats[c]:
+                threats[c].remove(index)
+                flipped.append((c, index))
+        own = threats[colour]
+        for step, (start, start_length, end, end_length) in zip(self.steps, saved):
+            for beyond in (start - step, end + step):
+                if colours[beyond] == 0:
+                    cell = beyond - self.margin
+                    if self.is_winning(cell, colour) != (cell in own):
+                        own.symmetric_difference_update((cell,))
+                        flipped.append((colour, cell))
+        return flipped
+
+    def remove(self):
+        """Takes back the last stone placed."""
+        i, saved, flipped = self.changes.pop()
+        for runs, (start, start_length, end, end_length) in zip(self.runs, saved):
+            runs[end] = end_length
+            runs[start] = start_length
+        self.colour[i] = 0
+        if flipped:
+            for colour, cell in flipped:
+                self.threats[colour].symmetric_difference_update((cell,))
+
+    def line_length(self, index: int, colour: int, direction: int) -> int:
+        """
+        Returns the length of the line a stone of the given colour on the (empty) cell with the given bit index
+        would be part of, in the given direction (0 .. 3, see steps).
+        """
+        i = index + self.margin
+        step = self.steps[direction]
+        runs = self.runs[direction]
+        left = runs[i - step] if self.colour[i - step] == colour else 0
+        right = runs[i + step] if self.colour[i + step] == colour else 0
+        return left + 1 + right
+
+    def is_winning(self, index: int, colour: int) -> bool:
+        """Returns whether a stone of the given colour on the (empty) cell with the given bit index wins."""
+        for direction in range(4):
+            if self.line_length(index, colour, direction) == 5:
+                return True
+        return False
+
+
+_NEIGHBOURHOODS = {}
+
+
+def _neighbourhoods(bsize_: int, distance: int) -> list:
+    """
+    Returns (and caches), for each BitBoard bit index of a board, the cells within the given Chebyshev
+    distance of it (itself included), as a list of (move, bit index) pairs.
+    """
+    key = (bsize_, distance)
+    result = _NEIGHBOURHOODS.get(key)
+    if result is None:
+        stride = bsize_ + 1
+        result = [[] for i in range(bsize_ * stride)]
+        for row, col in itertools.product(range(bsize_), range(bsize_)):
+            for r in range(max(0, row - distance), min(bsize_, row + distance + 1)):
+                for c in range(max(0, col - distance), min(bsize_, col + distance + 1)):
+                    result[row * stride + col].append(((r, c), r * stride + c))
+        _NEIGHBOURHOODS[key] = result
+    return result
+
+
+class Position:
+    """
+    A mutable game position for search code. play(move) places a stone on a BitBoard in place,
+    and undo() takes back the last move played, such that a search can walk down and back up
+    its tree without allocating a board per node.
+    The set of empty cells, the ply counter and the Zobrist hash (see zobrist_hash) are
+    maintained incrementally.
+    Optionally, it also maintains the set of candidate moves: the empty cells within a Chebyshev
+    distance of candidate_distance of any stone. valid_moves then only returns those.
+    With track_lines, it maintains a LineTable, which makes the win check in play constant time,
+    and with track_threats, the LineTable keeps the threats as well (see LineTable).
+    """
+
+    def __init__(self, bsize_: int = SIZE, candidate_distance: int = None, track_lines: bool = False, track_threats: bool = False):
+        self.board = BitBoard(bsize_)
+        self.ply = 1
+        self.empty = set(itertools.product(range(bsize_), range(bsize_)))
+        self.history = []  # the undo stack: the moves played on this position, in order
+        self.keys = zobrist_keys(bsize_)
+        self.hash = 0
+        self.candidates = None
+        if candidate_distance is not None:
+            self.neighbourhoods = _neighbourhoods(bsize_, candidate_distance)
+            self.near = [0] * (bsize_ * (bsize_ + 1))  # per cell: the number of stones within the distance
+            self.candidates = set()
+        self.lines = LineTable(bsize_, track_threats) if track_lines or track_threats else None
+
+    @staticmethod
+    def from_state(state: GameState, candidate_distance: int = None, track_lines: bool = False, track_threats: bool = False) -> "Position":
+        """
+        Creates a position from a game state (with either a numpy board or a BitBoard).
+        The state itself is not modified. Note that the moves that lead to the state are unknown,
+        so they cannot be undone.
+        :param candidate_distance: the distance for the candidate moves (by default they are not maintained)
+        :param track_lines: whether to maintain a LineTable
+        :param track_threats: whether the LineTable keeps the threats as well (this implies track_lines)
+        """
+        board = state[0]
+        if isinstance(board, BitBoard):
+            position = Position(board.size, candidate_distance, track_lines, track_threats)
+            position.board.stones = board.stones[:]
+        else:
+            position = Position(np.shape(board)[0], candidate_distance, track_lines, track_threats)
+            position.board = to_bitboard(board)
+        position.ply = state[1]
+        position.empty = set(_bitboard_valid_moves(position.board, 2))
+        position.hash = zobrist_hash(position.board)
+        if position.candidates is not None:
+            stones = position.board.stones[1] | position.board.stones[2]
+            while stones:
+                lowest = stones & -stones
+                for cell, i in position.neighbourhoods[lowest.bit_length() - 1]:
+                    position.near[i] += 1
+                stones ^= lowest
+            position.candidates = {cell for cell in position.empty if position.near[cell[0] * position.board.stride + cell[1]] > 0}
+        if position.lines is not None:
+            for colour in (1, 2):
+                stones = position.board.stones[colour]
+                while stones:
+                    lowest = stones & -stones
+                    position.lines.place(lowest.bit_length() - 1, colour)
+                    stones ^= lowest
+            position.lines.changes = []  # the stones of the state cannot be taken back
+        return position
+
+    def state(self) -> GameState:
+        """Returns the game state (board and ply). NB: the board is shared with this position."""
+        return self.board, self.ply
+
+    def last_move(self) -> Move:
+        """Returns the last move played on this position, or () if there is none."""
+        return self.history[-1] if self.history else ()
+
+    def valid_moves(self) -> List[Move]:
+        """
+        The same moves as valid_moves(state), but without scanning the board.
+        When candidate moves are maintained, only those are returned (unless there are none).
+        """
+        if self.ply == 1:
+            middle = self.board.size // 2
+            return [(middle, middle)]
+        if self.candidates:
+            return list(self.candidates)
+        return list(self.empty)
+
+    def play(self, move: Move) -> Tuple[bool, bool]:
+        """
+        Plays a move in place.
+        :param move: a move (tuple indicating location of stone to place)
+        :return: whether the move was valid and whether the move wins the game
+        """
+        if move not in self.empty:
+            return False, False
+        board = self.board
+        if self.ply == 1 and move != (board.size // 2, board.size // 2):
+            return False, False
+        colour = 2 if self.ply % 2 else 1
+        index = move[0] * board.stride + move[1]
+        board.stones[colour] |= 1 << index
+        self.hash ^= self.keys[colour][index]
+        self.empty.remove(move)
+        self.history.append(move)
+        self.ply += 1
+        if self.candidates is not None:
+            self.candidates.discard(move)
+            near = self.near
+            for cell, i in self.neighbourhoods[index]:
+                near[i] += 1
+                if near[i] == 1 and cell in self.empty:
+                    self.candidates.add(cell)
+        if self.lines is not None:
+            return True, self.lines.place(index, colour)
+        stones = board.stones[colour]
+        stride = board.stride
+        for step in (1, stride, stride + 1, stride - 1):
+            if _exact_five_through(stones, index, step):
+                return True, True
+        return True, False
+
+    def undo(self) -> Move:
+        """
+        Takes back the last move played.
+        :return: the move that was taken back
+        """
+        move = self.history.pop()
+        self.ply -= 1
+        colour = 2 if self.ply % 2 else 1
+        index = move[0] * self.board.stride + move[1]
+        self.board.stones[colour] &= ~(1 << index)
+        self.hash ^= self.keys[colour][index]
+        self.empty.add(move)
+        if self.lines is not None:
+            self.lines.remove()
+        if self.candidates is not None:
+            near = self.near
+            for cell, i in self.neighbourhoods[index]:
+                near[i] -= 1
+                if near[i] == 0:
+                    self.candidates.discard(cell)
+            if near[index] > 0:
+                self.candidates.add(move)
+        return move
+
+    def rewind(self, ply: int):
+        """Takes back moves until the position is at the given ply again."""
+        while self.ply > ply:
+            self.undo()
+
+
 def pretty_board(board: Board):
     """
     Function to print the board to the standard out
     :param board: a d by d list representing the board, 0 being empty, 1 black stone, and 2 a white stone
     """
+    if isinstance(board, BitBoard):
+        board = to_numpy(board)
     for row in board:
         for val in row:
             if val == 0:
@@ -2,6 +2,7 @@
 from flask import Flask, request, json, Response
 from bson import json_util
 import logging
+import gomoku_wire
 
 import random, time
 
@@ -13,7 +14,18 @@ app = Flask(__name__)
 def make_gomoku_move_9g3():
     # IncrementalStringDecode
 
-    data = request.json
+    binary = request.content_type == gomoku_wire.CONTENT_TYPE
+    if binary:
+        try:
+            data = gomoku_wire.decode_request(request.get_data())
+        except gomoku_wire.WireError as error:
+            return Response(
+                response=json.dumps({"Error": str(error)}),
+                status=400,
+                mimetype="application/json",
+            )
+    else:
+        data = request.json
     ar_error = []
 
     if data is None or data == {}:
@@ -29,6 +41,10 @@ def make_gomoku_move_9g3():
 
     gomoku_ai = gomoku_random_ai_webServer()
     move = gomoku_ai.move(data)
+    if binary:
+        return Response(
+            response=gomoku_wire.encode_move(move), status=200, mimetype=gomoku_wire.CONTENT_TYPE
+        )
 
     # dicResponse,ar_error = temptest(data)
     # if(len(ar_error)!=0): return MongoAPI.returnErrors(ar_error)
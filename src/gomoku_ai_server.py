@@ -0,0 +1,274 @@
+# A move server for production use: an asyncio front end that accepts many connections at once,
+# and a pool of worker processes that run the AIs. Each game session is pinned to one worker, which keeps
+# the AI of that session alive between moves (so an MCTS player can reuse its search tree).
+# Sessions that have been idle for a while are evicted.
+#
+# It speaks the same protocol as gomoku_ai_random_webserver.py: POST /make_gomoku_move/<ai> with the
+# request as JSON or in the binary format of gomoku_wire. A request belongs to a session when it has an
+# X-Gomoku-Session header (or a "session" field in JSON); without one, a fresh AI makes the move,
+# just like the flask server does. Within a session, the client can send steps instead of the full
+# position: the worker keeps the board of the session, and asks for the full position (409) when the
+# checksum of a step does not match it.
+# A request that has to wait for its worker (which is busy with a move of another session) gets that much
+# less time to think, so the reply still comes in time. HEAD requests (the round trip probes of the client)
+# are answered with just the headers.
+
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+import gomoku_wire
+
+SESSION_HEADER = "x-gomoku-session"
+RESYNC = "resync"  # the error of a step that does not match the board of the session
+
+
+def _worker(conn, players: dict):
+    """
+    The body of a worker process: it keeps the AI (and the board) of each session pinned to it, and makes the moves.
+    Messages: ("move", request_id, session, ai, data, arrival) with a full request, ("step", request_id, session,
+    ai, data, arrival) with a step (see gomoku_wire), both answered with (request_id, move or None, error or None),
+    ("evict", session) and ("stop",). arrival is the time.time() at which the server received the request: the time
+    the request has waited since is taken off its time to move.
+    """
+    sessions = {}  # session -> [player, board, ply]: the board after the last move, and the ply to move
+    while True:
+        message = conn.recv()
+        if message[0] in ("move", "step"):
+            request_id, session, ai, data, arrival = message[1:]
+            try:
+                state = sessions.get(session)
+                if message[0] == "step":
+                    if state is None or state[1] is None or state[2] != data["ply"] - 1:
+                        conn.send((request_id, None, RESYNC))
+                        continue
+                    board = state[1]
+                    if data["last_move"]:
+                        row, col = data["last_move"]
+                        board[row][col] = 2 if (data["ply"] - 1) % 2 else 1
+                    if gomoku_wire.board_checksum(board) != data["checksum"]:
+                        state[1] = None  # the next request of the session has to send the full board
+                        conn.send((request_id, None, RESYNC))
+                        continue
+                else:
+                    if state is None:
+                        state = [players[ai](), None, 0]
+                        state[0].new_game(data["black"])
+                        if session is not None:
+                            sessions[session] = state
+                    board = np.array(data["board"], dtype=np.int8)
+                    state[1] = board
+                last_move = tuple(data["last_move"]) if data["last_move"] else ()
+                waited_ms = (time.time() - arrival) * 1000
+                max_time_to_move = max(1, int(data["max_time_to_move"] - waited_ms))
+                move = state[0].move((board.copy(), data["ply"]), last_move, max_time_to_move)
+                move = (int(move[0]), int(move[1]))
+                # keep the board of the session up to date with the move of the AI, for the next step
+                board[move[0]][move[1]] = 2 if data["ply"] % 2 else 1
+                state[2] = data["ply"] + 1
+                conn.send((request_id, move, None))
+            except Exception as error:  # the request is answered in any case, with the error
+                conn.send((request_id, None, repr(error)))
+        elif message[0] == "evict":
+            sessions.pop(message[1], None)
+        else:  # "stop"
+            conn.close()
+            return
+
+
+class MoveServer:
+    """
+    The asyncio front end. Requests wait for their worker without blocking the event loop: the replies
+    of the workers are read when their pipe becomes readable.
+    """
+
+    def __init__(self, players: dict, workers: int = None, idle_timeout: float = 600, host: str = "0.0.0.0", port: int = 5000):
+        """
+        :param players: The AIs to serve, by name (the last part of the url): a class or function that
+        creates a new player. They are created in the worker processes.
+        :param workers: The number of worker processes (by default one per core).
+        :param idle_timeout: The seconds after which a session without requests is evicted.
+        """
+        self.players = players
+        self.workers = workers or os.cpu_count() or 1
+        self.idle_timeout = idle_timeout
+        self.host = host
+        self.port = port
+        self.connections = []
+        self.processes = []
+        self.pins = {}  # session -> worker index
+        self.last_used = {}  # session -> time of its last request
+        self.pending = {}  # request id -> future of the reply
+        self.busy = []  # per worker: the number of requests it has not answered yet
+        self.request_ids = itertools.count()
+
+    def start_workers(self):
+        loop = asyncio.get_running_loop()
+        for i in range(self.workers):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker, args=(child_conn, self.players))
+            process.start()
+            child_conn.close()
+            loop.add_reader(parent_conn.fileno(), self.read_replies, i)
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+            self.busy.append(0)
+
+    def stop_workers(self):
+        loop = asyncio.get_running_loop()
+        for conn, process in zip(self.connections, self.processes):
+            loop.remove_reader(conn.fileno())
+            conn.send(("stop",))
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self.connections = []
+        self.processes = []
+
+    def read_replies(self, worker: int):
+        conn = self.connections[worker]
+        while conn.poll():
+            request_id, move, error = conn.recv()
+            self.busy[worker] -= 1
+            future = self.pending.pop(request_id)
+            if not future.done():
+                future.set_result((move, error))
+
+    def worker_for(self, session) -> int:
+        """Returns the worker of a session; a new session goes to the worker with the fewest sessions."""
+        if session is None:
+            return min(range(self.workers), key=lambda i: self.busy[i])
+        worker = self.pins.get(session)
+        if worker is None:
+            counts = [0] * self.workers
+            for pinned in self.pins.values():
+                counts[pinned] += 1
+            worker = min(range(self.workers), key=lambda i: (counts[i], self.busy[i]))
+            self.pins[session] = worker
+        self.last_used[session] = time.monotonic()
+        return worker
+
+    async def make_move(self, session, ai: str, data: dict, kind: str = "move"):
+        arrival = time.time()  # (a wall clock time, as the worker compares it with its own clock)
+        worker = self.worker_for(session)
+        request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.busy[worker] += 1
+        self.connections[worker].send((kind, request_id, session, ai, data, arrival))
+        return await future
+
+    async def evict_idle_sessions(self):
+        while True:
+            await asyncio.sleep(self.idle_timeout / 4)
+            now = time.monotonic()
+            for session, last_used in list(self.last_used.items()):
+                if now - last_used > self.idle_timeout:
+                    self.connections[self.pins.pop(session)].send(("evict", session))
+                    del self.last_used[session]
+
+    async def handle_request(self, method: str, path: str, headers: dict, body: bytes):
+        """Returns the status, content type and body of the response."""
+        prefix = "/make_gomoku_move/"
+        ai = path[len(prefix):] if path.startswith(prefix) else None
+        if method == "HEAD":  # (handle_connection leaves out the body)
+            return (200 if ai in self.players else 404), "application/json", b""
+        if method != "POST" or ai not in self.players:
+            return 404, "application/json", json.dumps({"Error": "not found"}).encode()
+        binary = headers.get("content-type", "").startswith(gomoku_wire.CONTENT_TYPE)
+        session = headers.get(SESSION_HEADER)
+        kind = "move"
+        try:
+            if binary and gomoku_wire.is_step(body):
+                if session is None:
+                    raise ValueError("a step needs a session")
+                data = gomoku_wire.decode_step(body)
+                kind = "step"
+            elif binary:
+                data = gomoku_wire.decode_request(body)
+            else:
+                data = json.loads(body)
+                if not isinstance(data, dict):
+                    raise ValueError("the request is not a JSON object")
+                session = data.get("session", session)
+        except ValueError as error:  # (gomoku_wire.WireError is a ValueError too)
+            return 400, "application/json", json.dumps({"Error": str(error)}).encode()
+
+        move, error = await self.make_move(session, ai, data, kind)
+        if error == RESYNC:
+            return 409, gomoku_wire.CONTENT_TYPE, b""
+        if error is not None:
+            return 500, "application/json", json.dumps({"Error": error}).encode()
+        if binary:
+            return 200, gomoku_wire.CONTENT_TYPE, gomoku_wire.encode_move(move)
+        return 200, "application/json", json.dumps({"move": move}).encode()
+
+    async def handle_connection(self, reader, writer):
+        """Serves the HTTP/1.1 requests of one connection, which is kept alive until the client closes it."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                method, path, version = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, content_type, response = await self.handle_request(method, path, headers, body)
+                if method == "HEAD":
+                    response = b""
+                close = headers.get("connection", "").lower() == "close" or version == "HTTP/1.0"
+                writer.write(
+                    (
+                        "HTTP/1.1 " + str(status) + " " + ("OK" if status == 200 else "Error") + "\r\n"
+                        + "Content-Type: " + content_type + "\r\n"
+                        + "Content-Length: " + str(len(response)) + "\r\n"
+                        + ("Connection: close\r\n" if close else "")
+                        + "\r\n"
+                    ).encode("latin-1")
+                    + response
+                )
+                await writer.drain()
+                if close:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            return
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self.start_workers()
+        eviction = asyncio.ensure_future(self.evict_idle_sessions())
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            eviction.cancel()
+            self.stop_workers()
+
+    def run(self):
+        """Serves until the process is interrupted."""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    from champion_v2 import ChampionV2
+    from random_agent import random_dummy_player
+
+    MoveServer({"ai_random": random_dummy_player, "ai_champion": ChampionV2}).run()
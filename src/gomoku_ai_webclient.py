@@ -0,0 +1,256 @@
+import os
+import random
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import gomoku
+import gomoku_wire
+
+# The connection pools, per process: a requests.Session must not be shared with a forked process
+# (for example a worker of the parallel competition).
+_sessions = {}
+
+
+def shared_session(pool_size=8):
+    """Returns the requests.Session of this process, which keeps its connections alive between requests."""
+    session = _sessions.get(os.getpid())
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _sessions[os.getpid()] = session
+    return session
+
+
+# The base class of the players that let a webserver choose their moves (see gomoku_ai_random_webserver.py).
+# All web players share one pool of keep-alive connections, so a move does not pay for a TCP and TLS handshake.
+# The server gets max_time_to_move minus the expected network overhead to think. That overhead is estimated
+# from the measured round trip times (like TCP does: the smoothed RTT plus 4 times its mean deviation),
+# instead of a fixed 600 ms. When the server does not answer in time, a random move is played.
+# The requests are sent in the binary format of gomoku_wire when the server supports it, and in JSON otherwise.
+# With wire_format "session", only the first request of a game sends the position: after that, each request
+# is a step of a few bytes (the last move and a checksum of the board), until the server asks for a resync.
+class gomoku_ai_webclient:
+    url = None  # the move endpoint of the server, set by the subclasses
+    initial_overhead_ms = 600  # the overhead that is assumed until the round trip time has been measured
+
+    def __init__(
+        self,
+        black_=True,
+        winningSeries_=5,
+        boardSize_=gomoku.SIZE,
+        connect_timeout=2.0,
+        rtt_probes=3,
+        safety_margin_ms=50,
+        wire_format="binary",
+        verbose=False,
+    ):
+        """
+        :param connect_timeout: the maximum time in seconds to set up a connection to the server
+        :param rtt_probes: the number of requests that measure the round trip time at the start of each game
+        :param safety_margin_ms: the time kept on top of the estimated overhead
+        :param wire_format: "binary" sends the board packed in 2 bits per cell, "moves" sends the moves
+        of the game (see gomoku_wire), "session" sends the board once and then just the steps of the game
+        (for gomoku_ai_server.py), "json" sends the board as JSON. The binary formats fall back to JSON
+        for servers that do not support them.
+        :param verbose: whether to print the reply and the time of each move
+        """
+        self.black = black_
+        self.winningSeries = winningSeries_
+        self.boardSize = boardSize_
+        self.connect_timeout = connect_timeout
+        self.rtt_probes = rtt_probes
+        self.safety_margin_ms = safety_margin_ms
+        self.wire_format = wire_format
+        self.verbose = verbose
+        self.moves = []  # the moves of the current game, for the "moves" wire format
+        self.synced = False  # whether the server has the board of this game, for the "session" wire format
+        self.session = uuid.uuid4().hex  # identifies the game to servers that keep an AI per game
+        self.srtt_ms = None  # the smoothed round trip time
+        self.rttvar_ms = None  # and its mean deviation
+
+    def new_game(self, black_):
+        self.black = black_
+        self.moves = []
+        self.synced = False
+        self.session = uuid.uuid4().hex
+        self.measure_rtt()
+
+    def measure_rtt(self):
+        """Measures the round trip time to the server with a few HEAD requests, which also open the connection."""
+        for i in range(self.rtt_probes):
+            start_time_ns = time.time_ns()
+            try:
+                shared_session().head(self.url, timeout=self.connect_timeout)
+            except requests.RequestException:
+                return
+            self.add_rtt_sample((time.time_ns() - start_time_ns) / 1000000)
+
+    def add_rtt_sample(self, rtt_ms):
+        # the estimator of TCP (RFC 6298)
+        if self.srtt_ms is None:
+            self.srtt_ms = rtt_ms
+            self.rttvar_ms = rtt_ms / 2
+        else:
+            self.rttvar_ms = 0.75 * self.rttvar_ms + 0.25 * abs(self.srtt_ms - rtt_ms)
+            self.srtt_ms = 0.875 * self.srtt_ms + 0.125 * rtt_ms
+
+    def overhead_ms(self):
+        """The time a request is expected to take on top of the time the server thinks."""
+        if self.srtt_ms is None:
+            return self.initial_overhead_ms
+        return self.srtt_ms + 4 * self.rttvar_ms + self.safety_margin_ms
+
+    def move(self, gamestate, last_move, max_time_to_move=1000):
+        # So the server has less time because of the send request en receive response
+        max_time_for_server_script = max(1, int(max_time_to_move - self.overhead_ms()))
+        if last_move:
+            self.moves.append(last_move)
+
+        # the request may not take longer than the player may: then it falls back on a random move
+        timeout = max(0.001, (max_time_to_move - self.safety_margin_ms) / 1000)
+
+        # measure the time spent
+        start_time_ns = time.time_ns()
+        try:
+            move = self.request_move(gamestate, last_move, max_time_for_server_script, timeout)
+        except (requests.RequestException, ValueError, KeyError):
+            # no (usable) answer in time: better a random move than exceeding the time limit
+            move = tuple(int(x) for x in random.choice(gomoku.valid_moves(gamestate)))
+            self.moves.append(move)
+            return move
+        time_spent_ms = (time.time_ns() - start_time_ns) / 1000000
+        # the server may think shorter than it is allowed to, so only a longer request says something about the overhead
+        if time_spent_ms > max_time_for_server_script:
+            self.add_rtt_sample(time_spent_ms - max_time_for_server_script)
+
+        if self.verbose:
+            print(move)
+            print(time_spent_ms)
+
+        self.moves.append(move)
+        return move
+
+    def request_move(self, gamestate, last_move, max_time_for_server_script, timeout):
+        """Sends the request in the wire format, falling back to JSON if the server does not support it."""
+        start_time_ns = time.time_ns()
+        if self.wire_format == "session" and self.synced:
+            move = self.request_step(gamestate, last_move, max_time_for_server_script, timeout)
+            if move is not None:
+                return move
+            timeout -= (time.time_ns() - start_time_ns) / 1000000000
+            if timeout <= 0:
+                raise requests.Timeout("no time left to send the full position")
+        if self.wire_format != "json":
+            # the move list is only complete when this player has seen every move of the game
+            moves = self.moves if self.wire_format == "moves" and len(self.moves) == gamestate[1] - 1 else None
+            data = gomoku_wire.encode_request(
+                gamestate[0],
+                gamestate[1],
+                last_move,
+                max_time_for_server_script,
+                self.winningSeries,
+                self.black,
+                moves,
+            )
+            req = shared_session().post(
+                self.url,
+                data=data,
+                headers={
+                    "Content-Type": gomoku_wire.CONTENT_TYPE,
+                    "Accept": gomoku_wire.ACCEPT,
+                    "X-Gomoku-Session": self.session,
+                },
+                timeout=(min(self.connect_timeout, timeout), timeout),
+            )
+            if req.status_code == 200 and req.headers.get("Content-Type", "").startswith(gomoku_wire.CONTENT_TYPE):
+                self.synced = self.wire_format == "session"
+                return gomoku_wire.decode_move(req.content)
+            # the server does not speak the binary format: use JSON from now on
+            self.wire_format = "json"
+            timeout -= (time.time_ns() - start_time_ns) / 1000000000
+            if timeout <= 0:
+                raise requests.Timeout("no time left to send the request in JSON")
+
+        req = shared_session().post(
+            self.url,
+            json=self.request_data(gamestate, last_move, max_time_for_server_script),
+            headers={"X-Gomoku-Session": self.session},
+            timeout=(min(self.connect_timeout, timeout), timeout),
+        )
+        # json kent geen tuples. Die maakt er arrays van. Dus zelf even converteren naar een tuple.
+        return tuple(req.json()["move"])
+
+    def request_step(self, gamestate, last_move, max_time_for_server_script, timeout):
+        """
+        Sends just the last move and the checksum of the board to a server that has the board of this game.
+        Returns None when the server asks for the full position (409), after which it has to be sent.
+        """
+        self.synced = False  # until the server has answered: a step that timed out may not have been applied
+        data = gomoku_wire.encode_step(
+            gamestate[1],
+            last_move,
+            max_time_for_server_script,
+            gomoku_wire.board_checksum(gamestate[0]),
+        )
+        req = shared_session().post(
+            self.url,
+            data=data,
+            headers={
+                "Content-Type": gomoku_wire.CONTENT_TYPE,
+                "Accept": gomoku_wire.ACCEPT,
+                "X-Gomoku-Session": self.session,
+            },
+            timeout=(min(self.connect_timeout, timeout), timeout),
+        )
+        if req.status_code == 200 and req.headers.get("Content-Type", "").startswith(gomoku_wire.CONTENT_TYPE):
+            self.synced = True
+            return gomoku_wire.decode_move(req.content)
+        if req.status_code != 409:
+            # the server does not keep the board of the game: send the full position from now on
+            self.wire_format = "binary"
+        return None
+
+    def request_data(self, gamestate, last_move, max_time_for_server_script):
+        # fill a dic with info to post.
+        dic = {}
+        dic["board"] = self.convertToList(
+            gamestate[0]
+        )  # lists can be json serialised, opposed to numpy arrays,therefore convert first.
+        dic["ply"] = gamestate[1]
+        dic["last_move"] = self.convertToIntTuple(
+            last_move
+        )  # (int8,int8) cannot properly be json serialised
+        dic["max_time_to_move"] = max_time_for_server_script
+        dic["winningSeries"] = self.winningSeries
+        dic["boardSize"] = self.boardSize
+        dic["black"] = self.black
+        return dic
+
+    def id(self):
+        return "webclient"
+
+    def convertToIntTuple(self, tup):
+        if tup == None or tup == ():
+            return None
+        else:
+            return (int(tup[0]), int(tup[1]))
+
+    def convertToList(self, board):
+        if type(board) == type([]):
+            return board  # no conversion needed
+        else:  # it must be a numpy array. Convert it to list:
+            boardAsList = []
+            for row in board:
+                lstRow = []
+                for number in row:
+                    # because e.g. int8 numpy types cannot be json serialised.
+                    lstRow.append(
+                        int(number)
+                    )  # because e.g. int8 numpy types cannot be json serialised.
+                boardAsList.append(lstRow)
+        return boardAsList
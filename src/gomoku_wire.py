@@ -0,0 +1,163 @@
+# A compact binary format for the move requests of the web players (see gomoku_ai_webclient.py)
+# and the webserver (see gomoku_ai_random_webserver.py), as an alternative to JSON.
+#
+# A request is a fixed header followed by the position:
+#   magic "GW", version, format, board size, winning series, black, ply, time to move (ms), last move
+# The position is either the board, packed in 2 bits per cell (format BOARD), or the list of moves
+# from the start of the game, 2 bytes per move (format MOVES), which is the smaller one for the first
+# bsize * bsize / 8 moves. The numbers in the header are little endian.
+# The reply is just the move: 2 bytes, row and column.
+#
+# Within a session (see gomoku_ai_server.py), a client that has sent the position once can send just a step:
+#   magic "GI", version, ply, time to move (ms), last move, checksum of the board after the last move
+# The server keeps the board of the session up to date with the steps and its own moves. When the checksum
+# (see board_checksum) does not match its board, it replies 409 and the client sends the full position again.
+#
+# The client sends a binary request with "Accept: application/x-gomoku, application/json".
+# A server that understands it replies in binary; a server that does not, replies with an error or JSON,
+# after which the client falls back to JSON.
+
+import struct
+import zlib
+import numpy as np
+
+CONTENT_TYPE = "application/x-gomoku"
+ACCEPT = CONTENT_TYPE + ", application/json"
+
+MAGIC = b"GW"
+STEP_MAGIC = b"GI"
+VERSION = 1
+BOARD = 0  # the position as a packed board
+MOVES = 1  # the position as the list of moves played
+
+_HEADER = struct.Struct("<2sBBBBBHIBB")
+_STEP = struct.Struct("<2sBHIBBI")
+_NO_MOVE = 255  # a row and column of 255 mean that there is no last move
+
+
+class WireError(ValueError):
+    """Raised for data that is not a valid request or reply."""
+
+
+_WEIGHTS = np.array([1, 4, 16, 64], dtype=np.uint8)
+_UNPACKED = ((np.arange(256, dtype=np.uint8)[:, None] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 3).astype(np.int8)
+
+
+def pack_board(board) -> bytes:
+    """Packs a board (numpy array or list of lists, cells 0, 1 or 2) in 2 bits per cell, row by row."""
+    cells = np.asarray(board, dtype=np.uint8).reshape(-1)
+    if len(cells) % 4:
+        cells = np.concatenate((cells, np.zeros(-len(cells) % 4, dtype=np.uint8)))
+    return (cells.reshape(-1, 4) @ _WEIGHTS).astype(np.uint8).tobytes()
+
+
+def unpack_board(data: bytes, bsize: int) -> np.ndarray:
+    """The inverse of pack_board: returns a bsize x bsize int8 array."""
+    if len(data) != (bsize * bsize + 3) // 4:
+        raise WireError("the board does not have " + str(bsize * bsize) + " cells")
+    cells = _UNPACKED[np.frombuffer(data, dtype=np.uint8)].reshape(-1)
+    return cells[: bsize * bsize].reshape(bsize, bsize)
+
+
+def board_from_moves(moves, bsize: int) -> np.ndarray:
+    """Replays the moves from the start of the game: black plays the odd plies, which place colour 2 (see gomoku.move)."""
+    moves = np.asarray(moves, dtype=np.intp).reshape(-1, 2)
+    if len(moves) and moves.max() >= bsize:
+        raise WireError("a move is outside of the board")
+    board = np.zeros((bsize, bsize), dtype=np.int8)
+    board[moves[:, 0], moves[:, 1]] = np.where(np.arange(1, len(moves) + 1) % 2, 2, 1)
+    return board
+
+
+def encode_request(board, ply, last_move, max_time_to_move, winning_series, black, moves=None) -> bytes:
+    """
+    Encodes a move request.
+    :param moves: the moves played from the start of the game; when given, they are sent instead of the board
+    """
+    bsize = len(board)
+    row, col = last_move if last_move else (_NO_MOVE, _NO_MOVE)
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        BOARD if moves is None else MOVES,
+        bsize,
+        winning_series,
+        bool(black),
+        ply,
+        max(0, int(max_time_to_move)),
+        row,
+        col,
+    )
+    if moves is None:
+        return header + pack_board(board)
+    return header + np.asarray(moves, dtype=np.uint8).tobytes()
+
+
+def decode_request(data: bytes) -> dict:
+    """
+    Decodes a move request into the same dictionary as the JSON requests:
+    board, ply, last_move, max_time_to_move, winningSeries, boardSize and black.
+    """
+    if len(data) < _HEADER.size:
+        raise WireError("the request is too short")
+    magic, version, kind, bsize, winning_series, black, ply, max_time_to_move, row, col = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise WireError("not a version " + str(VERSION) + " request")
+    body = data[_HEADER.size :]
+    if kind == BOARD:
+        board = unpack_board(body, bsize)
+    elif kind == MOVES:
+        if len(body) % 2 != 0:
+            raise WireError("the move list has an odd length")
+        board = board_from_moves(np.frombuffer(body, dtype=np.uint8), bsize)
+    else:
+        raise WireError("unknown format " + str(kind))
+    return {
+        "board": board,
+        "ply": ply,
+        "last_move": None if row == _NO_MOVE else (row, col),
+        "max_time_to_move": max_time_to_move,
+        "winningSeries": winning_series,
+        "boardSize": bsize,
+        "black": bool(black),
+    }
+
+
+def board_checksum(board) -> int:
+    """The CRC-32 of the packed board, with which client and server check that they have the same board."""
+    return zlib.crc32(pack_board(board))
+
+
+def is_step(data: bytes) -> bool:
+    return data[:2] == STEP_MAGIC
+
+
+def encode_step(ply, last_move, max_time_to_move, checksum) -> bytes:
+    """Encodes a step in a session: the last move, and the checksum of the board after it."""
+    row, col = last_move if last_move else (_NO_MOVE, _NO_MOVE)
+    return _STEP.pack(STEP_MAGIC, VERSION, ply, max(0, int(max_time_to_move)), row, col, checksum)
+
+
+def decode_step(data: bytes) -> dict:
+    """Decodes a step into a dictionary with ply, last_move, max_time_to_move and checksum."""
+    if len(data) != _STEP.size:
+        raise WireError("a step is " + str(_STEP.size) + " bytes")
+    magic, version, ply, max_time_to_move, row, col, checksum = _STEP.unpack(data)
+    if magic != STEP_MAGIC or version != VERSION:
+        raise WireError("not a version " + str(VERSION) + " step")
+    return {
+        "ply": ply,
+        "last_move": None if row == _NO_MOVE else (row, col),
+        "max_time_to_move": max_time_to_move,
+        "checksum": checksum,
+    }
+
+
+def encode_move(move) -> bytes:
+    return bytes((int(move[0]), int(move[1])))
+
+
+def decode_move(data: bytes) -> tuple:
+    if len(data) != 2:
+        raise WireError("a move is 2 bytes")
+    return data[0], data[1]
@@ -0,0 +1,192 @@
+# A match between two builds of a player: plays games until a sequential probability ratio test (SPRT)
+# can tell whether the new build is stronger than the old one by a given number of Elo points.
+
+import math
+
+from competition import Competition, LatencyHistogram, play_game
+from process_player import ProcessPlayer
+
+
+def elo_from_score(score: float) -> float:
+    """Returns the Elo difference that gives the expected score (between 0 and 1) in the logistic model."""
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def score_from_elo(elo: float) -> float:
+    """Returns the expected score for the given Elo difference in the logistic model."""
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+class MatchStatistics:
+    """
+    The results of a match so far, from the point of view of the new player,
+    with the Elo estimate, its confidence interval and the log-likelihood ratio of the SPRT.
+    """
+
+    PRIOR = 0.5  # The pseudo wins and pseudo losses added to the games in the estimate of the variance
+
+    def __init__(self):
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+
+    def add(self, score: float):
+        """Adds the result of a game: 1 for a win, 0.5 for a draw and 0 for a loss of the new player."""
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    def score(self) -> float:
+        """The mean score of the new player."""
+        return (self.wins + 0.5 * self.draws) / self.games
+
+    def variance(self) -> float:
+        """
+        The variance of the score of one game. It is estimated with PRIOR wins and PRIOR losses added to
+        the games, such that it is not 0 while all games have had the same result (which would keep the SPRT
+        from ever stopping, even when the new player wins every game).
+        """
+        games = self.games + 2 * MatchStatistics.PRIOR
+        wins = self.wins + MatchStatistics.PRIOR
+        mean = (wins + 0.5 * self.draws) / games
+        return (wins + 0.25 * self.draws) / games - mean * mean
+
+    def elo(self, z: float = 1.96) -> tuple:
+        """
+        Returns the estimated Elo difference, and the bounds of its confidence interval
+        (by default 95%, from the normal approximation of the mean score).
+        """
+        mean = self.score()
+        margin = z * math.sqrt(self.variance() / self.games)
+        return elo_from_score(mean), elo_from_score(mean - margin), elo_from_score(mean + margin)
+
+    def llr(self, elo0: float, elo1: float) -> float:
+        """
+        The log-likelihood ratio of the hypothesis that the Elo difference is elo1 against the hypothesis
+        that it is elo0, in the normal approximation of the mean score (as used by most engine testing
+        frameworks). It is 0 before the first game.
+        """
+        if self.games == 0:
+            return 0.0
+        variance = self.variance()
+        s0 = score_from_elo(elo0)
+        s1 = score_from_elo(elo1)
+        return (s1 - s0) * (2 * self.score() - s0 - s1) * self.games / (2 * variance)
+
+
+class Match(Competition):
+    """
+    A match between a new and an old build of a player, on top of the game loop of Competition.
+    The players take turns playing black. After every game the Elo estimate is updated, and the match
+    stops as soon as the SPRT accepts either H0 (the new build is elo0 stronger) or H1 (elo1 stronger).
+    The games end up in the results matrix (and the store) of the competition, just like in play_competition.
+    """
+
+    def __init__(self, new_player, old_player, bsize_=19, store=None):
+        """
+        :param new_player: The player that is tested (it gets place 0).
+        :param old_player: The player to compare it with (place 1).
+        """
+        super().__init__(bsize_, store)
+        self.register_player(new_player)
+        self.register_player(old_player)
+        self.statistics = MatchStatistics()
+
+    def play_match(
+        self,
+        elo0=0.0,
+        elo1=10.0,
+        alpha=0.05,
+        beta=0.05,
+        max_games=1000,
+        maxtime_per_move=1000,
+        tolerance=0.05,
+        isolate_players=False,
+        on_timeout="forfeit",
+        verbose=True,
+    ):
+        """
+        Plays games until the SPRT decides, or until max_games have been played.
+
+        :param elo0: The Elo gain of the new player under H0.
+        :param elo1: The Elo gain of the new player under H1.
+        :param alpha: The probability of accepting H1 when H0 holds.
+        :param beta: The probability of accepting H0 when H1 holds.
+        :param isolate_players: Whether to run the players in subprocesses, with a hard deadline per move
+        (see Competition.play_competition, just like on_timeout).
+        :param verbose: Whether to print the statistics after every game.
+        :return: "H1" if the new player is stronger, "H0" if it is not, or None if max_games did not suffice.
+        """
+        self.results = [[0.0, 0.0], [0.0, 0.0]]
+        self.statistics = MatchStatistics()
+        self.latencies = [LatencyHistogram(), LatencyHistogram()]
+        players = self.players
+        if isolate_players:
+            players = [ProcessPlayer(player, 1.0 + tolerance) for player in self.players]
+        try:
+            return self.play_games(players, elo0, elo1, alpha, beta, max_games, maxtime_per_move, tolerance, on_timeout, verbose)
+        finally:
+            if isolate_players:
+                for player in players:
+                    player.close()
+
+    def play_games(self, players, elo0, elo1, alpha, beta, max_games, maxtime_per_move, tolerance, on_timeout, verbose):
+        """The game loop of play_match, with the given (possibly isolated) players."""
+        lower = math.log(beta / (1 - alpha))
+        upper = math.log((1 - beta) / alpha)
+        finished = set()
+        if self.store is not None:
+            self.store.register_players([player.id() for player in self.players])
+            finished = self.store.finished_games()
+
+        for n in range(max_games):
+            # game n: the new player plays black in the even games, in game pair n // 2
+            i, j = (0, 1) if n % 2 == 0 else (1, 0)
+            k = n // 2
+            if (i, j, k) in finished:
+                score = self.store.game(i, j, k)[0]
+                self.results[i][j] += score
+                self.results[j][i] += 1 - score
+            else:
+                score, moves, times = play_game(players, i, j, self.bsize, maxtime_per_move, tolerance, on_timeout)
+                self.add_result(i, j, k, score, moves, times)
+            self.statistics.add(score if i == 0 else 1 - score)
+
+            llr = self.statistics.llr(elo0, elo1)
+            if verbose:
+                self.print_statistics(llr, lower, upper)
+            if llr >= upper:
+                return "H1"
+            if llr <= lower:
+                return "H0"
+        return None
+
+    def print_statistics(self, llr, lower, upper):
+        """Prints the results so far, the Elo estimate with its 95% confidence interval and the LLR."""
+        statistics = self.statistics
+        elo, elo_low, elo_high = statistics.elo()
+        print(
+            "games " + str(statistics.games)
+            + " (+" + str(statistics.wins) + " =" + str(statistics.draws) + " -" + str(statistics.losses) + ")"
+            + " elo " + str(round(elo, 1))
+            + " [" + str(round(elo_low, 1)) + ", " + str(round(elo_high, 1)) + "]"
+            + " llr " + str(round(llr, 2))
+            + " (" + str(round(lower, 2)) + ", " + str(round(upper, 2)) + ")"
+        )
+
+
+if __name__ == "__main__":
+    from champion_v2 import ChampionV2
+
+    match = Match(ChampionV2(rollout_policy="threats"), ChampionV2())
+    result = match.play_match(elo0=0, elo1=10, maxtime_per_move=1000)
+    print("accepted: " + str(result))
+    match.print_scores()
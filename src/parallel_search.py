@@ -0,0 +1,373 @@
+# Parallel versions of the ChampionV2 search, in worker processes
+# (threads would not help: the search is pure Python, so it is bound by the GIL).
+
+import multiprocessing
+import os
+import random
+import time
+from multiprocessing import shared_memory
+
+import gomoku
+from array_tree import ArrayTree
+from gomoku import Move, GameState
+
+
+def _root_worker(conn, seed: int, options: dict):
+    """
+    The body of a root-parallel worker process: a ChampionV2 of its own, that searches the positions
+    it receives and sends back the statistics of its root children.
+    """
+    from champion_v2 import ChampionV2
+
+    random.seed(seed)
+    player = ChampionV2(**options)
+    while True:
+        message = conn.recv()
+        if message[0] == "new_game":
+            player.new_game(message[1])
+        elif message[0] == "search":
+            state, last_move, max_time_to_move = message[1:]
+            player.move(state, last_move, max_time_to_move)
+            conn.send(player.root_statistics())
+        else:  # "stop"
+            conn.close()
+            return
+
+
+class RootParallelPool:
+    """
+    Root parallelisation: W worker processes each run an independent search of the same position for
+    the same time budget. Their root children statistics (N and Q per move) are merged afterwards.
+    The workers are started once (per game, see ChampionV2.new_game) instead of per move, so starting
+    processes does not eat into the time to move. Each worker keeps its own tree between moves.
+    """
+
+    def __init__(self, workers: int, black: bool, options: dict):
+        """
+        :param workers: The number of worker processes.
+        :param black: Whether the player plays black.
+        :param options: The keyword arguments for the ChampionV2 of each worker.
+        """
+        self.connections = []
+        self.processes = []
+        for i in range(workers):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_root_worker,
+                args=(child_conn, random.getrandbits(32), options),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+        self.new_game(black)
+
+    def new_game(self, black: bool):
+        for conn in self.connections:
+            conn.send(("new_game", black))
+
+    def search(self, state: GameState, last_move: Move, max_time_to_move: int) -> dict:
+        """
+        Lets all workers search the state for max_time_to_move milliseconds.
+
+        :return: The merged statistics: a dictionary from each root move to its summed [N, Q].
+        """
+        for conn in self.connections:
+            conn.send(("search", state, last_move, max_time_to_move))
+        merged = {}
+        for conn in self.connections:
+            for move, N, Q in conn.recv():
+                statistics = merged.setdefault(move, [0, 0])
+                statistics[0] += N
+                statistics[1] += Q
+        return merged
+
+    def close(self):
+        """Stops the worker processes."""
+        for conn, process in zip(self.connections, self.processes):
+            try:
+                conn.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self.connections = []
+        self.processes = []
+
+
+def _tree_worker(conn, seed: int, options: dict, memory, capacity: int, lock):
+    """
+    The body of a tree-parallel worker process: a ChampionV2 that searches the array tree in shared memory,
+    together with the other workers.
+    """
+    from champion_v2 import ChampionV2
+
+    random.seed(seed)
+    player = ChampionV2(**options)
+    tree = ArrayTree(capacity, memory.buf)
+    while True:
+        message = conn.recv()
+        if message[0] == "new_game":
+            player.new_game(message[1])
+        elif message[0] == "search":
+            state, max_time_to_move = message[1:]
+            player.position = player.new_position(state)
+            player.search_array(time.time_ns(), max_time_to_move, tree, lock)
+            conn.send(True)
+        else:  # "stop"
+            del tree
+            conn.close()
+            return
+
+
+class TreeParallelSearch:
+    """
+    Tree parallelisation: W worker processes select, expand and back up on a single ArrayTree that is held
+    in multiprocessing.shared_memory. Expanding a node is guarded by a lock; the statistics themselves are
+    updated without one. Virtual losses keep the workers spread over different paths
+    (see ChampionV2.add_virtual_loss). The result is one deeper tree instead of W shallow ones.
+    Like RootParallelPool, the workers are started once per game.
+    """
+
+    def __init__(self, workers: int, black: bool, options: dict, capacity: int):
+        """
+        :param workers: The number of worker processes.
+        :param black: Whether the player plays black.
+        :param options: The keyword arguments for the ChampionV2 of each worker.
+        :param capacity: The maximum number of nodes in the shared tree.
+        """
+        self.capacity = capacity
+        self.memory = shared_memory.SharedMemory(create=True, size=ArrayTree.nbytes(capacity))
+        self.tree = ArrayTree(capacity, self.memory.buf)
+        self.tree.reset()
+        self.lock = multiprocessing.Lock()
+        self.connections = []
+        self.processes = []
+        for i in range(workers):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_tree_worker,
+                args=(child_conn, random.getrandbits(32), options, self.memory, capacity, self.lock),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+        self.new_game(black)
+
+    def new_game(self, black: bool):
+        for conn in self.connections:
+            conn.send(("new_game", black))
+
+    def search(self, state: GameState, last_move: Move, max_time_to_move: int) -> dict:
+        """
+        Lets all workers search the state in the shared tree for max_time_to_move milliseconds.
+
+        :return: The statistics of the root children: a dictionary from each root move to its [N, Q].
+        """
+        tree = self.tree
+        tree.reset()
+        for conn in self.connections:
+            conn.send(("search", state, max_time_to_move))
+        for conn in self.connections:
+            conn.recv()
+        board = state[0]
+        size = board.size if isinstance(board, gomoku.BitBoard) else len(board)
+        first = tree.first_child[0]
+        return {
+            divmod(int(tree.move[i]), size): [int(tree.N[i]), float(tree.Q[i])]
+            for i in range(first, first + tree.tried[0])
+        }
+
+    def close(self):
+        """Stops the worker processes and frees the shared memory."""
+        for conn, process in zip(self.connections, self.processes):
+            try:
+                conn.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self.connections = []
+        self.processes = []
+        if self.memory is not None:
+            self.tree = None  # the arrays of the tree must be released before the memory can be closed
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+
+def _lower_priority():
+    """
+    Lets the process run only on CPU time that no other process wants: with the idle scheduling policy
+    of Linux, or else with the lowest priority (nice 19) that the platform has.
+    """
+    try:
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+    except (AttributeError, OSError):
+        try:
+            os.nice(19)
+        except (AttributeError, OSError):
+            pass
+
+
+def _ponder_worker(conn, seed: int, options: dict, strict: bool):
+    """
+    The body of the pondering process: a ChampionV2 that searches the position after the move of the player,
+    until it is told the move of the opponent, and then sends back the subtree of that move.
+    """
+    from champion_v2 import ChampionV2, Node
+
+    random.seed(seed)
+    if strict:
+        _lower_priority()
+    player = ChampionV2(**options)
+    root = None
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:  # the player is gone (for example terminated by the referee)
+            return
+        if message[0] == "ponder":
+            state, move, subtree = message[1:]
+            player.position = player.new_position(state)
+            move_is_valid, winning_move = player.position.play(move)
+            root = None
+            if subtree is not None and subtree.ply == player.position.ply:
+                root = subtree  # the search of the player, to search on from
+            elif move_is_valid:
+                root = Node(player.position.ply, None, move, winning_move)
+            if player.transpositions is not None:
+                player.transpositions.clear()
+            # search until the player has a message (the move of the opponent)
+            while root is not None and root.proven == 0 and not conn.poll():
+                player.search_iteration(root)
+        elif message[0] == "stop":
+            last_move = message[1]
+            subtree = None
+            if root is not None and last_move in root.child_moves:
+                subtree = root.child_nodes[root.child_moves.index(last_move)]
+                subtree.parent_node = None
+                player.position.play(last_move)
+            conn.send((subtree, player.position.hash if subtree is not None else None))
+            root = None
+        elif message[0] == "new_game":
+            player.new_game(message[1])
+        else:  # "close"
+            conn.close()
+            return
+
+
+class Ponderer:
+    """
+    Pondering: a process that searches on the time of the opponent. After the player has moved, it searches
+    the position the opponent is to move in. When the opponent has moved, it hands over the subtree of that
+    move, so the player can search on from there (see ChampionV2.move).
+    The process only searches between stop and start, so it never competes with the search of the player itself.
+    A process that does not hand over its tree in time (because it gets no CPU time, see strict) is killed,
+    and a fresh one is started with the next start.
+    """
+
+    def __init__(self, black: bool, options: dict, strict: bool = False):
+        """
+        :param black: Whether the player plays black.
+        :param options: The keyword arguments for the ChampionV2 of the process.
+        :param strict: Whether the process may only use CPU time that nothing else wants (see _lower_priority),
+        so that it does not take CPU time from the opponent.
+        """
+        self.black = black
+        self.options = options
+        self.strict = strict
+        self.conn = None
+        self.process = None
+        self.pondering = False
+        self.start_process()
+
+    def start_process(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_ponder_worker,
+            args=(child_conn, random.getrandbits(32), self.options, self.strict),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.pondering = False
+        self.conn.send(("new_game", self.black))
+
+    def new_game(self, black: bool, timeout: float = 1.0):
+        self.black = black
+        self.stop(None, timeout=timeout)
+        if self.process is None:
+            self.start_process()
+        else:
+            self.conn.send(("new_game", black))
+
+    def start(self, state: GameState, move: Move, subtree=None):
+        """
+        Starts searching the position after the player has played move in state.
+
+        :param subtree: The node of move in the search of the player (detached from its parent), to search on
+        from; or None to start a new tree.
+        """
+        if self.process is None:
+            self.start_process()
+        self.conn.send(("ponder", state, move, subtree))
+        self.pondering = True
+
+    def stop(self, last_move: Move, state: GameState = None, timeout: float = None):
+        """
+        Stops searching, and returns the subtree of the opponent's last_move.
+
+        :param state: The state after last_move: the subtree is only returned when it is the node of this state.
+        :param timeout: The seconds to wait for the subtree (by default, as long as it takes). When the process
+        has not sent it by then, it is killed (see kill).
+        :return: The root of the subtree (detached from its parent), or None if it was not searched (in time).
+        """
+        if not self.pondering:
+            return None
+        self.pondering = False
+        if last_move is not None and len(last_move) == 2:
+            last_move = (int(last_move[0]), int(last_move[1]))
+        self.conn.send(("stop", last_move))
+        if not self.conn.poll(timeout):
+            self.kill()
+            return None
+        subtree, position_hash = self.conn.recv()
+        if subtree is None or state is None:
+            return None
+        if subtree.ply != state[1] or position_hash != gomoku.zobrist_hash(state[0]):
+            return None
+        return subtree
+
+    def kill(self):
+        """Stops the process right away (SIGKILL, which works even when it gets no CPU time at all)."""
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+        self.conn = None
+        self.process = None
+        self.pondering = False
+
+    def close(self):
+        """Stops the process."""
+        if self.process is None:
+            return
+        try:
+            self.conn.send(("close",))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+        self.conn = None
+        self.process = None
@@ -0,0 +1,150 @@
+# Runs a player in a process of its own, so that the referee can stop it when it does not move in time.
+
+import multiprocessing
+import multiprocessing.util
+import random
+
+from gomoku import Move, GameState
+
+
+class MoveTimeout(Exception):
+    """Raised by ProcessPlayer.move when the player did not return a move before its deadline."""
+
+
+class PlayerCrashed(MoveTimeout):
+    """
+    Raised by ProcessPlayer.move when the subprocess of the player died before it returned a move.
+    It is a MoveTimeout, as the move will not come in time either (see competition.play_game).
+    """
+
+
+def _player_process(conn, player, seed: int):
+    """The body of the process of a ProcessPlayer: it passes the messages on to the player."""
+    random.seed(seed)
+    while True:
+        message = conn.recv()
+        if message[0] == "new_game":
+            player.new_game(message[1])
+        elif message[0] == "move":
+            state, last_move, max_time_to_move = message[1:]
+            conn.send(player.move(state, last_move, max_time_to_move))
+        else:  # "stop"
+            if hasattr(player, "close"):  # (a player with processes of its own stops them)
+                player.close()
+            conn.close()
+            return
+
+
+def _stop_process(conn, process, grace: float):
+    """
+    Stops the subprocess of a ProcessPlayer: asks it to stop, and terminates it when it has not stopped
+    within grace seconds.
+    """
+    if grace > 0:
+        try:
+            conn.send(("stop",))
+        except (BrokenPipeError, OSError):
+            pass
+        process.join(timeout=grace)
+    if process.is_alive():
+        process.terminate()
+    process.join()
+    conn.close()
+
+
+class ProcessPlayer:
+    """
+    A player that runs another player in a subprocess, and talks to it over a pipe:
+    ("new_game", black), ("move", state, last_move, max_time_to_move) which is answered with the move,
+    and ("stop",). move waits at most until the hard deadline. A player that misses it is terminated,
+    and a fresh copy of the player is started for the next move (it is told about the game with new_game,
+    so it only loses what it kept between moves).
+
+    The subprocess is started when the first game starts, so a ProcessPlayer can be sent to another process
+    (the parallel competition) before that. It is not daemonic, so that the player can start processes of its
+    own (like ChampionV2 with workers or pondering); it is stopped when this process exits, before
+    multiprocessing waits for its children.
+    """
+
+    def __init__(self, player, hard_limit_factor: float = 1.05):
+        """
+        :param player: The player to run. It is copied into the subprocess.
+        :param hard_limit_factor: The deadline of a move, relative to its max_time_to_move.
+        """
+        self.player = player
+        self.hard_limit_factor = hard_limit_factor
+        self.name = player.id()
+        self.cores = getattr(player, "cores", 1)
+        self.black = True
+        self.conn = None
+        self.process = None
+        self.finalizer = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["conn"] = None
+        state["process"] = None
+        state["finalizer"] = None
+        return state
+
+    def start(self):
+        """Starts the subprocess with a fresh copy of the player."""
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_player_process,
+            args=(child_conn, self.player, random.getrandbits(32)),
+            daemon=False,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        # (the finalizers with an exit priority run before multiprocessing joins the children at exit)
+        self.finalizer = multiprocessing.util.Finalize(self, _stop_process, args=(self.conn, self.process, 1.0), exitpriority=10)
+
+    def new_game(self, black_: bool):
+        self.black = black_
+        if self.process is not None and not self.process.is_alive():
+            self.kill()  # it died after its last move: start a fresh copy
+        if self.process is None:
+            self.start()
+        self.conn.send(("new_game", black_))
+
+    def move(self, state: GameState, last_move: Move, max_time_to_move: int = 1000) -> Move:
+        """
+        Lets the player in the subprocess choose a move.
+
+        :raises MoveTimeout: when the player has not answered within max_time_to_move * hard_limit_factor
+        milliseconds (measured here, so including the communication). The player is terminated then.
+        :raises PlayerCrashed: when the subprocess died (for example because the player raised an exception).
+        """
+        if self.process is None:
+            self.new_game(self.black)
+        try:
+            self.conn.send(("move", state, last_move, max_time_to_move))
+            if not self.conn.poll(max_time_to_move * self.hard_limit_factor / 1000):
+                self.kill()
+                raise MoveTimeout(self.name + " did not move within " + str(max_time_to_move) + " ms")
+            return self.conn.recv()
+        except (EOFError, OSError) as error:  # (a ConnectionError is an OSError)
+            self.kill()
+            raise PlayerCrashed(self.name + " died before it moved (" + repr(error) + ")")
+
+    def kill(self):
+        """Stops the subprocess right away, while it may still be busy with a move."""
+        self.finalizer.cancel()
+        _stop_process(self.conn, self.process, 0)
+        self.conn = None
+        self.process = None
+        self.finalizer = None
+
+    def close(self):
+        """Stops the subprocess, giving the player a moment to stop by itself."""
+        if self.process is None:
+            return
+        self.finalizer()  # (which runs _stop_process only once)
+        self.conn = None
+        self.process = None
+        self.finalizer = None
+
+    def id(self) -> str:
+        return self.name
@@ -0,0 +1,113 @@
+# Vectorized rollouts: plays many random games from the same position at once,
+# as a (K, N, N) stack of boards, instead of one game at a time in a Python loop.
+
+import numpy as np
+from functools import lru_cache
+
+import gomoku
+from gomoku import GameState
+
+_rng = np.random.default_rng()
+
+
+@lru_cache(maxsize=None)
+def _line_indices(bsize: int) -> np.ndarray:
+    """
+    For every cell and each of the 4 directions, the flat indices of the cells at offsets -5 .. +5
+    along that direction (offset 0 being the cell itself). Cells outside of the board point to
+    the extra cell at index bsize * bsize, which is always empty.
+    :return: an int array of shape (bsize * bsize, 4, 11)
+    """
+    outside = bsize * bsize
+    offsets = np.arange(-5, 6)
+    rows, cols = np.divmod(np.arange(bsize * bsize), bsize)
+    lines = np.empty((bsize * bsize, 4, 11), dtype=np.intp)
+    for d, (dr, dc) in enumerate(((0, 1), (1, 0), (1, 1), (1, -1))):
+        r = rows[:, None] + dr * offsets[None, :]
+        c = cols[:, None] + dc * offsets[None, :]
+        inside = (r >= 0) & (r < bsize) & (c >= 0) & (c < bsize)
+        lines[:, d, :] = np.where(inside, r * bsize + c, outside)
+    return lines
+
+
+@lru_cache(maxsize=None)
+def _exact_five_table() -> np.ndarray:
+    """
+    Looking at one line of 11 cells as an 11-bit code (bit i set when the cell at offset i - 5 has
+    the colour of the stone at offset 0), entry code of this table tells whether that stone is
+    part of /exactly/ 5 in a row.
+    """
+    table = np.zeros(1 << 11, dtype=bool)
+    for code in range(1 << 11):
+        length = 1
+        for i in range(6, 11):
+            if not (code >> i) & 1:
+                break
+            length += 1
+        for i in range(4, -1, -1):
+            if not (code >> i) & 1:
+                break
+            length += 1
+        table[code] = length == 5
+    return table
+
+
+_LINE_WEIGHTS = (1 << np.arange(11)).astype(np.int16)
+
+
+def winning_moves(
+    boards: np.ndarray, games: np.ndarray, cells: np.ndarray, colour: int, bsize: int
+) -> np.ndarray:
+    """
+    The vectorized version of gomoku.check_win: checks for a batch of flat boards (with the extra
+    empty cell at the end) whether the stone just placed on cells[k] is part of /exactly/ 5 in a row.
+    :param boards: int8 array of shape (K, bsize * bsize + 1)
+    :param games: the indices of the boards to check
+    :param cells: the flat index of the last move on each of those boards
+    :param colour: the colour of the stones that were placed
+    :param bsize: the size of the board
+    :return: a bool array with the same length as games
+    """
+    lines = _line_indices(bsize)[cells]  # (len(games), 4, 11)
+    same = boards.reshape(-1).take(games[:, None, None] * boards.shape[1] + lines) == colour
+    codes = np.dot(same.reshape(-1, 11).astype(np.int16), _LINE_WEIGHTS)
+    return _exact_five_table()[codes].reshape(len(games), 4).any(axis=1)
+
+
+def batch_rollout(state: GameState, k: int, rng: np.random.Generator = None) -> np.ndarray:
+    """
+    Plays k independent random games from the given state, all in parallel.
+    Just like a single rollout that shuffles the valid moves once and plays them in that order,
+    every game gets its own random permutation of the empty cells up front. All games are at the
+    same ply, so each ply is one vectorized move plus one vectorized win check.
+    :param state: the state to play from (with a numpy board or a BitBoard); it is not modified
+    :param k: the number of games to play
+    :param rng: the numpy random generator to use (a module-wide one by default)
+    :return: an int8 array of length k with the winning colour of each game (1 or 2), or 0 for a draw
+    """
+    if rng is None:
+        rng = _rng
+    board, ply = gomoku.state_to_numpy(state)
+    bsize = np.shape(board)[0]
+    ncells = bsize * bsize
+    flat = np.zeros(ncells + 1, dtype=np.int8)
+    flat[:ncells] = np.asarray(board).reshape(-1)
+    boards = np.repeat(flat[None, :], k, axis=0)
+
+    empty = np.flatnonzero(flat[:ncells] == 0)
+    orders = empty[np.argsort(rng.random((k, len(empty))), axis=1)]
+
+    winners = np.zeros(k, dtype=np.int8)
+    active = np.arange(k)
+    for t in range(len(empty)):
+        colour = 2 if ply % 2 else 1
+        cells = orders[active, t]
+        boards[active, cells] = colour
+        won = winning_moves(boards, active, cells, colour, bsize)
+        if won.any():
+            winners[active[won]] = colour
+            active = active[~won]
+            if len(active) == 0:
+                break
+        ply += 1
+    return winners
@@ -0,0 +1,352 @@
+# Threat-space search: finds forced wins that consist of threats, which a Monte Carlo search only
+# finds with very many rollouts (see ChampionV2.move).
+#
+# A four is a move after which the attacker wins with its next move, so the defender has to block it.
+# A double four makes two winning cells at once (for example an open four): the defender can block only one.
+# A three is a move after which the attacker threatens to make a double four, so the defender has to prevent that.
+# VCF (victory by continuous fours) plays only fours, so every reply of the defender is forced.
+# VCT (victory by continuous threats) plays threes as well, and has to win against every reply that stops them.
+# Both run on a gomoku.Position with line tables that keep the threats, which are exactly the winning cells
+# (see gomoku.LineTable).
+
+import time
+
+import gomoku
+from gomoku import GameState, Move
+
+
+class _OutOfTime(Exception):
+    """Raised inside a ThreatSearch when its time is up."""
+
+
+class ThreatSearch:
+    """
+    VCF and VCT search for the player to move, with a transposition cache of the positions
+    searched before, which is kept between searches (positions come back in the next moves).
+    Cells are BitBoard bit indices (see gomoku.BitBoard), except in the public methods, which use moves.
+    """
+
+    FOUR = 0    # The kinds of search, in the keys of the cache
+    THREAT = 1
+
+    def __init__(self, vcf_depth: int = 12, vct_depth: int = 2, cache_size: int = 1 << 16):
+        """
+        :param vcf_depth: The maximum number of fours in a VCF.
+        :param vct_depth: The maximum number of threes in a VCT (each followed by a VCF of at most vcf_depth fours).
+        :param cache_size: The maximum number of cached positions; the cache is cleared when it is full.
+        """
+        self.vcf_depth = vcf_depth
+        self.vct_depth = vct_depth
+        self.cache_size = cache_size
+        self.cache = {}                 # (hash, ply % 2, kind) -> (winning cell or None, depth searched)
+        self.position = None
+        self.deadline = 0
+        self.nodes = 0
+
+    def find_win(self, state: GameState, max_time_ms: float) -> Move:
+        """
+        Looks for a forced win of the player to move.
+
+        :param state: The state to search.
+        :param max_time_ms: The time the search may take, in milliseconds.
+        :return: The first move of a forced win, or None if there is none (or none was found in time).
+
+        Runtime complexity: exponential in vct_depth and vcf_depth, bounded by max_time_ms
+        """
+        self.start(state, max_time_ms)
+        try:
+            cell = self.deepening()
+        except _OutOfTime:
+            return None
+        return None if cell is None else self.to_move(cell)
+
+    def find_defences(self, state: GameState, max_time_ms: float) -> list:
+        """
+        Looks for a forced win of the opponent, as if it could move now (a null move), and then
+        for the moves of the player to move after which the opponent has no forced win any more.
+        Only moves that can stop the opponent's first threat are tried, and the opponent's counter threats
+        are searched with the same depths, so the moves returned are the defences that this search can see.
+
+        :return: None if the opponent has no forced win (or the search ran out of time); else the
+        list of defences. When none of the moves tried helps, these are the cells where the opponent would
+        win at once (so that it at least has to find the rest of its win), or an empty list if there are none.
+
+        Runtime complexity: exponential in vct_depth and vcf_depth, bounded by max_time_ms
+        """
+        board, ply = state
+        if ply < 3:
+            return None
+        self.start((board, ply + 1), max_time_ms)
+        try:
+            threat = self.deepening()
+            if threat is None:
+                return None
+            # the same stones, with the player to move again
+            self.position.ply -= 1
+            own = 2 if self.position.ply % 2 else 1
+            candidates = self.line_cells([threat]) | set(self.candidates(own, 3))
+            defences = []
+            for cell in sorted(candidates):
+                self.position.play(self.to_move(cell))
+                if self.vct(self.vct_depth) is None:
+                    defences.append(self.to_move(cell))
+                self.position.undo()
+            if not defences:
+                defences = [self.to_move(cell) for cell in sorted(self.position.lines.threats[3 - own])]
+            return defences
+        except _OutOfTime:
+            return None
+
+    def start(self, state: GameState, max_time_ms: float) -> None:
+        """Sets up the position of a new search, and its deadline."""
+        self.position = gomoku.Position.from_state(state, track_threats = True)
+        self.deadline = time.time_ns() + int(max_time_ms * 1000000)
+        self.nodes = 0
+        if len(self.cache) > self.cache_size:
+            self.cache.clear()
+
+    def deepening(self) -> int:
+        """
+        Searches a VCF first, and then VCTs with ever more threes, such that the short wins are found
+        before the time goes to the long ones.
+
+        :return: The cell to play, or None.
+        """
+        for depth in range(self.vct_depth + 1):
+            cell = self.vct(depth)
+            if cell is not None:
+                return cell
+        return None
+
+    def to_move(self, cell: int) -> Move:
+        return divmod(cell, self.position.board.stride)
+
+    def tick(self) -> None:
+        """Counts a node, and checks the deadline."""
+        self.nodes += 1
+        if time.time_ns() > self.deadline:
+            raise _OutOfTime()
+
+    def vcf(self, depth: int) -> int:
+        """
+        Searches a victory by continuous fours for the player to move.
+
+        :param depth: The maximum number of fours.
+        :return: The cell to play (a winning cell or the first four), or None.
+
+        Runtime complexity: O(b^depth), with b the number of fours per position
+        """
+        position = self.position
+        threats = position.lines.threats
+        attacker = 2 if position.ply % 2 else 1
+        if threats[attacker]:
+            return next(iter(threats[attacker]))
+        defender = 3 - attacker
+        if len(threats[defender]) > 1 or depth == 0:
+            return None
+        self.tick()
+        key = (position.hash, position.ply % 2, ThreatSearch.FOUR)
+        cached = self.cache.get(key)
+        if cached is not None and (cached[0] is not None or cached[1] >= depth):
+            return cached[0]
+
+        if threats[defender]:
+            # the defender threatens to win: only a block that is a four as well keeps the initiative
+            cells = list(threats[defender])
+        else:
+            cells = self.candidates(attacker, 3)
+        result = None
+        for cell in cells:
+            position.play(self.to_move(cell))
+            fours = threats[attacker]
+            if len(fours) >= 2 and not threats[defender]:
+                result = cell
+            elif len(fours) == 1 and not threats[defender]:
+                # the defender has to block the four
+                block_is_valid, block_wins = position.play(self.to_move(next(iter(fours))))
+                if not block_wins and self.vcf(depth - 1) is not None:
+                    result = cell
+                position.undo()
+            position.undo()
+            if result is not None:
+                break
+        self.cache[key] = (result, depth)
+        return result
+
+    def vct(self, depth: int) -> int:
+        """
+        Searches a victory by continuous threats (fours and threes) for the player to move.
+
+        :param depth: The maximum number of threes.
+        :return: The cell to play, or None.
+
+        Runtime complexity: O((b * r)^depth) VCF searches, with b the number of threes per position
+        and r the number of replies to a three
+        """
+        result = self.vcf(self.vcf_depth)
+        position = self.position
+        threats = position.lines.threats
+        attacker = 2 if position.ply % 2 else 1
+        defender = 3 - attacker
+        if result is not None or depth == 0 or threats[defender]:
+            return result
+        self.tick()
+        key = (position.hash, position.ply % 2, ThreatSearch.THREAT)
+        cached = self.cache.get(key)
+        if cached is not None and (cached[0] is not None or cached[1] >= depth):
+            return cached[0]
+
+        for cell in self.candidates(attacker, 2):
+            self.tick()
+            position.play(self.to_move(cell))
+            if not threats[attacker]:   # (a four would have been found by the VCF)
+                double_fours = self.double_fours(attacker)
+                if double_fours and self.wins_against_all_replies(double_fours, depth):
+                    result = cell
+            position.undo()
+            if result is not None:
+                break
+        self.cache[key] = (result, depth)
+        return result
+
+    def wins_against_all_replies(self, double_fours: list, depth: int) -> bool:
+        """
+        Checks whether the attacker, which has just played a three, wins against every reply of the defender
+        (who is to move) that stops the double fours: the moves on the lines through them, and the fours
+        of the defender. A stone anywhere else cannot change what the double fours threaten.
+
+        Runtime complexity: O(r) VCT searches of depth - 1, with r the number of replies
+        """
+        position = self.position
+        threats = position.lines.threats
+        defender = 2 if position.ply % 2 else 1
+        attacker = 3 - defender
+        # the double fours themselves are the likeliest to stop them, so they go first
+        others = (self.line_cells(double_fours) | set(self.candidates(defender, 3))).difference(double_fours)
+        for cell in double_fours + list(others):
+            self.tick()
+            position.play(self.to_move(cell))
+            # after a reply that is no four, a double four that is still there wins at once
+            won = (not threats[defender] and bool(self.double_fours(attacker, first_only = True))) or self.vct(depth - 1) is not None
+            position.undo()
+            if not won:
+                return False
+        return True
+
+    def double_fours(self, colour: int, first_only: bool = False) -> list:
+        """
+        Returns the cells where a stone of the given colour makes two winning cells at once.
+        The colour may be the player that is not to move: then its stone is played after a null move.
+
+        :param first_only: Whether to stop at the first one.
+
+        Runtime complexity: O(n), with n the number of candidate cells (see candidates)
+        """
+        position = self.position
+        threats = position.lines.threats[colour]
+        null_move = (2 if position.ply % 2 else 1) != colour
+        position.ply += null_move
+        found = []
+        for cell in self.candidates(colour, 3):
+            position.play(self.to_move(cell))
+            if len(threats) >= 2:
+                found.append(cell)
+            position.undo()
+            if found and first_only:
+                break
+        position.ply -= null_move
+        return found
+
+    def candidates(self, colour: int, minimum: int) -> list:
+        """
+        Returns the empty cells with at least minimum stones of the given colour in a window of five cells
+        through them (in one of the 4 directions) that holds no other stones and does not cross the edge:
+        with minimum 3, the cells that may make a four, with minimum 2, the ones that may make a three.
+
+        Runtime complexity: O(n), with n the number of stones of the colour
+        """
+        lines = self.position.lines
+        colours = lines.colour
+        margin = lines.margin
+        near = set()
+        stones = self.position.board.stones[colour]
+        while stones:
+            lowest = stones & -stones
+            i = lowest.bit_length() - 1 + margin
+            for step in lines.steps:
+                for direction in (step, -step):
+                    j = i
+                    for k in range(4):
+                        j += direction
+                        if colours[j] == 0:
+                            near.add(j)
+                        elif colours[j] != colour:
+                            break
+            stones ^= lowest
+        return [i - margin for i in near if self.has_window(i, colour, minimum)]
+
+    def has_window(self, i: int, colour: int, minimum: int) -> bool:
+        """
+        Returns whether there is a window of five cells through the (margin shifted) empty cell i, in one
+        of the 4 directions, with at least minimum stones of the given colour, no other stones and no edge.
+
+        Runtime complexity: O(1), 4 directions of at most 9 cells
+        """
+        colours = self.position.lines.colour
+        for step in self.position.lines.steps:
+            # the cells around i in this direction, up to the first other stone or edge: 1 for a stone of the colour
+            line = [0] * 9
+            left = 0
+            j = i
+            while left < 4:
+                j -= step
+                value = colours[j]
+                if value != 0 and value != colour:
+                    break
+                left += 1
+                line[4 - left] = value == colour
+            right = 0
+            j = i
+            while right < 4:
+                j += step
+                value = colours[j]
+                if value != 0 and value != colour:
+                    break
+                right += 1
+                line[4 + right] = value == colour
+            if left + right < 4:
+                continue
+            # slide the window from the leftmost to the rightmost position
+            start = 4 - left
+            last = min(4, right)
+            count = sum(line[start:start + 5])
+            while True:
+                if count >= minimum:
+                    return True
+                if start == last:
+                    break
+                count += line[start + 5] - line[start]
+                start += 1
+        return False
+
+    def line_cells(self, cells: list) -> set:
+        """
+        Returns the given cells and the empty cells within 4 steps of them on the 4 lines through them.
+
+        Runtime complexity: O(n), with n the number of cells
+        """
+        lines = self.position.lines
+        colours = lines.colour
+        margin = lines.margin
+        result = set(cells)
+        for cell in cells:
+            for step in lines.steps:
+                for direction in (step, -step):
+                    j = cell + margin
+                    for k in range(4):
+                        j += direction
+                        if colours[j] == -1:
+                            break
+                        if colours[j] == 0:
+                            result.add(j - margin)
+        return result
@@ -0,0 +1,92 @@
+import time
+
+
+class TimeManager:
+    """
+    Decides when the search for a move stops (see ChampionV2.move), instead of searching until exactly
+    the time to move is used:
+    - it stops early when the most visited move at the root can no longer be overtaken by the second one
+      in the time that is left (and the most visited move has the best value as well). The search then has to
+      play the most visited move (see stopped_early), as that is the move the stop is sure about,
+    - it searches on, up to the tolerance, when the time is up while the two best moves are close,
+    - it only looks at the clock every so many iterations: as many as take about check_ms, from the cost
+      of an iteration measured so far. It stops when the next look would come too late.
+    """
+
+    def __init__(self, tolerance: float = 0.0, early_stop: bool = True, check_ms: float = 1.0, close: float = 0.8):
+        """
+        :param tolerance: The fraction of the time to move that may be used on top of it when the two best moves
+        are close (as far as the referee allows it, see the tolerance of Competition.play_competition).
+        :param early_stop: Whether to stop as soon as the best move cannot be overtaken any more.
+        :param check_ms: About the milliseconds of searching between two looks at the clock.
+        :param close: The two best moves are close when the second has at least this fraction of the visits
+        of the first, or when the most visited move does not have the best value.
+        """
+        self.tolerance = tolerance
+        self.early_stop = early_stop
+        self.check_ns = check_ms * 1000000
+        self.close = close
+        self.search_start = 0
+        self.deadline = 0           # The end of the time to move,
+        self.extended_deadline = 0  # and of the tolerance after it
+        self.iterations = 0
+        self.next_check = 1
+        self.stopped_early = False  # Whether the last search stopped because its most visited move was certain
+
+    def start(self, max_time_to_move: float, start_time: int = None) -> None:
+        """
+        Starts the clock of a search.
+
+        :param max_time_to_move: The time to move in milliseconds,
+        :param start_time: from this time_ns() on (by default: now). The time before the search itself starts
+        (for example of the threat search) is not counted in the cost of an iteration.
+        """
+        self.search_start = time.time_ns()
+        if start_time is None:
+            start_time = self.search_start
+        self.deadline = start_time + int(max_time_to_move * 1000000)
+        self.extended_deadline = start_time + int(max_time_to_move * (1.0 + self.tolerance) * 1000000)
+        self.iterations = 0
+        self.next_check = 1
+        self.stopped_early = False
+
+    def tick(self) -> bool:
+        """
+        Counts an iteration of the search.
+
+        :return: Whether it is time to look at the clock (with keep_searching).
+
+        Runtime complexity: O(1)
+        """
+        self.iterations += 1
+        return self.iterations >= self.next_check
+
+    def keep_searching(self, best_visits: float, second_visits: float, agree: bool, visits_per_iteration: float = 1) -> bool:
+        """
+        Looks at the clock and the state of the search, and plans the next look.
+
+        :param best_visits: The visits of the most visited move at the root.
+        :param second_visits: The visits of the second most visited move.
+        :param agree: Whether the most visited move has the best value as well.
+        :param visits_per_iteration: The visits an iteration adds to one of the moves.
+        :return: Whether to go on searching.
+
+        Runtime complexity: O(1)
+        """
+        now = time.time_ns()
+        cost = (now - self.search_start) / self.iterations     # The mean time of an iteration so far
+        interval = max(1, int(self.check_ns / cost))
+        self.next_check = self.iterations + interval
+
+        close = not agree or second_visits >= self.close * best_visits
+        deadline = self.extended_deadline if close else self.deadline
+        # (with one iteration to spare, as an iteration can take longer than the mean)
+        if now + (interval + 1) * cost > deadline:
+            return False
+        if self.early_stop and agree:
+            # even if all iterations that fit in the time went to the second move, it would not catch up
+            iterations_left = (self.extended_deadline - now) / cost
+            if best_visits - second_visits > iterations_left * visits_per_iteration:
+                self.stopped_early = True
+                return False
+        return True